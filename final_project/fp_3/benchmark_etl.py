@@ -0,0 +1,179 @@
+"""
+This file contains the benchmark of the data_etl stages on synthetic
+price histories, run offline without any download.
+
+Usage: python benchmark_etl.py --rows 1000 10000 100000 1000000 --output results.json
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import pandas as pd
+import numpy as np
+from data_etl import MACRO_SYMBOLS, yf_data_upload, feature_engineering, simulate_ret
+
+TICKER_SYMBOL = 'SYN'
+
+
+def synthetic_fetcher(n_rows, seed=0, mu=0.08, sigma=0.3):
+    '''
+    Build a fetcher that returns geometric brownian motion price histories instead of
+    downloading them. Every symbol gets n_rows minute bars, the requested dates are ignored.
+
+    Input:
+        - n_rows: integer number of rows for every symbol
+        - seed: integer seed of the random generator
+        - mu: annual drift of the prices
+        - sigma: annual volatility of the prices
+
+    Return: fetcher function with the same signature as data_etl.yf_fetcher
+    '''
+    def fetcher(symbols, start_date, end_date):
+        # minute bars keep a million rows inside the range of pandas timestamps
+        index = pd.date_range('2010-12-31', periods=n_rows, freq='min', name='Date')
+        dt = 1 / 252
+        prices = {}
+
+        for offset, symbol in enumerate(symbols):
+            rng = np.random.default_rng(seed + offset)
+            log_ret = (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * rng.standard_normal(n_rows)
+            prices[symbol] = pd.DataFrame({
+                'Adj Close': 50 * np.exp(np.cumsum(log_ret)),
+                'Volume': rng.lognormal(15, 0.5, n_rows).astype(np.int64)
+            }, index=index)
+
+        return prices
+
+    return fetcher
+
+
+def _measure(stage, make_input, repeat):
+    '''
+    Time a stage on fresh input and record the peak memory it allocates.
+
+    Input:
+        - stage: function taking the input returned by make_input
+        - make_input: function building a fresh input for every run
+        - repeat: number of timed runs, the fastest is kept
+
+    Return: tuple of fastest wall time in seconds, peak allocated bytes and the stage output
+    '''
+    seconds = np.inf
+    for _ in range(repeat):
+        data = make_input()
+        start = time.perf_counter()
+        stage(data)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    # memory is measured on a separate run so tracing does not slow down the timings
+    data = make_input()
+    tracemalloc.start()
+    output = stage(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return seconds, peak, output
+
+
+def run_benchmark(rows, repeat=3, seed=0):
+    '''
+    Benchmark yf_data_upload, feature_engineering and simulate_ret on synthetic histories.
+
+    Input:
+        - rows: list of integer history lengths
+        - repeat: number of timed runs per stage, the fastest is kept
+        - seed: integer seed of the synthetic prices
+
+    Return: list of dictionaries with the stage, rows, seconds, rows_per_second and peak_bytes
+    '''
+    results = []
+
+    for n_rows in rows:
+        fetcher = synthetic_fetcher(n_rows, seed=seed)
+
+        # fetch once so the upload stage measures the frame construction and the join
+        prices = fetcher([TICKER_SYMBOL, *MACRO_SYMBOLS], None, None)
+
+        def cached(symbols, start_date, end_date):
+            return {symbol: prices[symbol] for symbol in symbols}
+
+        stages = [
+            ('yf_data_upload', lambda df: yf_data_upload(None, None, TICKER_SYMBOL, fetcher=cached), lambda: None),
+            ('feature_engineering', lambda df: feature_engineering(df, TICKER_SYMBOL), None),
+            ('simulate_ret', lambda df: simulate_ret(df, TICKER_SYMBOL), None)
+        ]
+
+        df = None
+        for stage_name, stage, make_input in stages:
+            # every stage runs on a fresh copy of the previous stage output
+            previous = df
+            make_input = make_input or (lambda: previous.copy())
+            seconds, peak, df = _measure(stage, make_input, repeat)
+
+            results.append({
+                'stage': stage_name,
+                'rows': n_rows,
+                'seconds': seconds,
+                'rows_per_second': n_rows / seconds if seconds > 0 else np.inf,
+                'peak_bytes': peak
+            })
+            print(f'{stage_name:>20} {n_rows:>9} rows: {seconds:9.4f}s  {n_rows / seconds:14,.0f} rows/s  {peak / 2 ** 20:9.1f} MiB peak')
+
+    return results
+
+
+def compare_results(results, baseline):
+    '''
+    Compare benchmark results with a previous run of the same stages and sizes.
+
+    Input:
+        - results: list of dictionaries from run_benchmark
+        - baseline: list of dictionaries from a previous run_benchmark
+
+    Return: DataFrame with the time and peak memory ratio (current / baseline) for every stage and size
+    '''
+    current = pd.DataFrame(results).set_index(['stage', 'rows'])
+    previous = pd.DataFrame(baseline).set_index(['stage', 'rows'])
+    joined = current.join(previous, rsuffix='_baseline', how='inner')
+
+    return pd.DataFrame({
+        'time_ratio': joined['seconds'] / joined['seconds_baseline'],
+        'memory_ratio': joined['peak_bytes'] / joined['peak_bytes_baseline']
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data_etl stages on synthetic price histories.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_etl.json', help='path of the json results')
+    parser.add_argument('--compare', help='path of a previous json results file to compare against')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.rows, repeat=args.repeat, seed=args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'results': results
+        }, f, indent=2)
+    print(f'results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare_results(results, json.load(f)['results']).round(3))
+
+
+if __name__ == '__main__':
+    main()
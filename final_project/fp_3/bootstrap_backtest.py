@@ -0,0 +1,196 @@
+"""
+This file contains the Monte Carlo bootstrap of the strategy returns.
+The daily returns of the base prices are resampled in blocks into
+synthetic price paths and the strategies are simulated on every path,
+giving distributions of final equity and drawdown instead of one path.
+
+Usage:
+    paths = bootstrap_backtest(df['TQQQ_close'], n_paths=5000, seed=642)
+    bootstrap_summary(paths)
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import pandas as pd
+import numpy as np
+from data_etl import _simulate_ret_arrays
+
+# base prices attached from shared memory in every worker
+_base = {}
+
+
+def simulate_ret_cash(close, ret):
+    '''
+    Cash of the perfect investment strategy of data_etl.simulate_ret on a price path.
+    '''
+    return _simulate_ret_arrays(close, ret)[1]
+
+
+def buy_and_hold_cash(close, ret):
+    '''
+    Cash of holding the security long for the whole path.
+    '''
+    return close
+
+
+STRATEGIES = {'simulate_ret': simulate_ret_cash, 'buy_and_hold': buy_and_hold_cash}
+BOOTSTRAP_METHODS = ('stationary', 'moving_block')
+
+
+def block_indices(rng, n_paths, n, block_size, method='stationary'):
+    '''
+    Resampled row positions of the base returns for every path.
+
+    Input:
+        - rng: numpy random Generator
+        - n_paths: integer number of paths
+        - n: integer number of base returns, also the length of every path
+        - block_size: integer block length, the mean block length for the stationary bootstrap
+        - method: 'stationary' for blocks of random (geometric) length wrapping around the end of the
+                  data, or 'moving_block' for blocks of fixed length that never wrap
+
+    Return: array of integer positions, paths x n
+    '''
+    if method == 'stationary':
+        # a new block starts with probability 1 / block_size, otherwise the next return follows
+        new_block = rng.random((n_paths, n)) < 1 / block_size
+        new_block[:, 0] = True
+        starts = rng.integers(0, n, size=(n_paths, n))
+        steps = np.arange(n)
+        block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+        return (np.take_along_axis(starts, block_start, axis=1) + steps - block_start) % n
+
+    if method == 'moving_block':
+        block_size = min(block_size, n)
+        n_blocks = -(-n // block_size)
+        starts = rng.integers(0, n - block_size + 1, size=(n_paths, n_blocks))
+        return (starts[:, :, None] + np.arange(block_size)).reshape(n_paths, -1)[:, :n]
+
+    raise ValueError(f'method must be one of {BOOTSTRAP_METHODS}, got {method!r}')
+
+
+def _attach(name, shape, dtype):
+    # keep the shared memory open for the life of the worker
+    memory = shared_memory.SharedMemory(name=name)
+    _base['memory'] = memory
+    _base['close'] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _simulate_chunk(args):
+    '''
+    Simulate one chunk of paths on the base prices in shared memory.
+
+    Input:
+        - args: tuple of the chunk seed, number of paths, block size, method and strategy names
+
+    Return: dictionary of strategy name to (final equity, max drawdown) arrays of the chunk
+    '''
+    seed, n_paths, block_size, method, strategy_names = args
+    close = _base['close']
+    ret = (close[1:] / close[:-1]) - 1
+    rng = np.random.default_rng(seed)
+
+    # every path starts from the first close and compounds the resampled returns
+    path_ret = np.zeros((n_paths, len(close)))
+    path_ret[:, 1:] = ret[block_indices(rng, n_paths, len(ret), block_size, method)]
+    path_close = close[0] * np.cumprod(1 + path_ret, axis=1)
+
+    results = {}
+    for name in strategy_names:
+        cash = np.array([STRATEGIES[name](path_close[path], path_ret[path]) for path in range(n_paths)])
+        drawdown = (cash / np.maximum.accumulate(cash, axis=1)) - 1
+        results[name] = (cash[:, -1] / cash[:, 0], drawdown.min(axis=1))
+
+    return results
+
+
+def bootstrap_backtest(close, n_paths=1000, block_size=20, method='stationary', strategies=('simulate_ret', 'buy_and_hold'),
+                       seed=None, chunk_size=100, max_workers=None):
+    '''
+    Resample the daily returns of the base prices into synthetic price paths and simulate the
+    strategies on every path across a process pool. The base prices are placed in shared memory
+    once instead of being pickled to every worker. Paths are drawn in chunks with their own seed
+    spawned from seed, so a fixed seed gives the same paths for any number of workers.
+
+    Input:
+        - close: array or Series of base closing prices
+        - n_paths: integer number of synthetic paths
+        - block_size: integer block length in rows, the mean block length for the stationary bootstrap
+        - method: 'stationary' or 'moving_block', see block_indices
+        - strategies: names of the strategies in STRATEGIES to simulate
+        - seed: integer seed for reproducible paths, None for fresh randomness
+        - chunk_size: integer number of paths simulated per task
+        - max_workers: integer number of processes, 1 runs every chunk in this process
+
+    Return: DataFrame with one row per path and strategy holding the final equity (as a multiple of
+            the starting cash) and the max drawdown
+    '''
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    if method not in BOOTSTRAP_METHODS:
+        raise ValueError(f'method must be one of {BOOTSTRAP_METHODS}, got {method!r}')
+    unknown = [name for name in strategies if name not in STRATEGIES]
+    if unknown:
+        raise ValueError(f'unknown strategies {unknown}, choose from {list(STRATEGIES)}')
+
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(chunk_seed, size, block_size, method, tuple(strategies)) for chunk_seed, size in zip(seeds, sizes)]
+
+    memory = shared_memory.SharedMemory(create=True, size=close.nbytes)
+    try:
+        np.ndarray(close.shape, dtype=close.dtype, buffer=memory.buf)[:] = close
+        init_args = (memory.name, close.shape, close.dtype)
+
+        if max_workers == 1:
+            _attach(*init_args)
+            try:
+                chunks = [_simulate_chunk(task) for task in tasks]
+            finally:
+                _base.pop('close', None)
+                _base.pop('memory').close()
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach, initargs=init_args) as pool:
+                chunks = list(pool.map(_simulate_chunk, tasks))
+    finally:
+        memory.close()
+        memory.unlink()
+
+    paths = []
+    for name in strategies:
+        final_equity = np.concatenate([chunk[name][0] for chunk in chunks])
+        max_drawdown = np.concatenate([chunk[name][1] for chunk in chunks])
+        paths.append(pd.DataFrame({
+            'path': np.arange(n_paths),
+            'strategy': name,
+            'final_equity': final_equity,
+            'max_drawdown': max_drawdown
+        }))
+
+    return pd.concat(paths, ignore_index=True)
+
+
+def bootstrap_summary(paths, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    '''
+    Distribution statistics of the bootstrapped paths.
+
+    Input:
+        - paths: DataFrame from bootstrap_backtest
+        - quantiles: sequence of quantiles to report
+
+    Return: DataFrame with the mean, standard deviation and quantiles of the final equity and
+            max drawdown of every strategy
+    '''
+    grouped = paths.groupby('strategy', sort=False)[['final_equity', 'max_drawdown']]
+    stats = grouped.agg(['mean', 'std'])
+
+    for q in quantiles:
+        quantile = grouped.quantile(q)
+        for column in quantile.columns:
+            stats[(column, f'q{q * 100:g}')] = quantile[column]
+
+    return stats.sort_index(axis=1, level=0, sort_remaining=False)
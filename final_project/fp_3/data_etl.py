@@ -8,265 +8,906 @@ Instructor: Janell Straach
 """
 
 # import necessary packages
+import os
+import json
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import yfinance as yf
 import warnings
+from itertools import islice
+from etl_instrumentation import instrument
 warnings.filterwarnings('ignore')
 
-def yf_data_upload(start_date, end_date, ticker_symbol):
+# macro ETFs joined onto every equity: bonds, inflation, dollar, volatility, oil and gold
+MACRO_SYMBOLS = ('TBF', 'TIP', 'UUP', 'VIXY', 'USO', 'GLD')
+
+# hold periods (in days) considered by the perfect investment strategy
+HOLD_HORIZONS = (1, 3, 5, 10, 20)
+
+# decision codes used by the array engine and the labels they map to
+DECISION_LONG, DECISION_SHORT, DECISION_HOLD = 0, 1, 2
+DECISION_LABELS = np.array(['long', 'short', 'hold'], dtype=object)
+
+def compact_dtype(column, horizons=HOLD_HORIZONS):
     '''
-    Call the yfinance and upload the required data. For our data requirements
-    we will choose a start date of 2010-12-31 and an end date of 2024-02-29.
+    Data type of a column under the opt-in compact schema: float32 for prices, returns and
+    indicators, categorical decision, int8 hold days and float32 volumes (int32 can overflow).
 
     Input:
-        - start: string date in the format of yyyy-dd-mm for the start date of the data putll
-        - end: string date in the format of yyyy-dd-mm for the end date of the data pull
-        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
-    
-    return: DataFrame of historical stock price data
+        - column: string column name
+        - horizons: sequence of integer hold periods, int16 hold days are used if any is over 127
+
+    Return: numpy or pandas dtype
+    '''
+    if column == 'decision':
+        return pd.CategoricalDtype(list(DECISION_LABELS))
+    if column in ('initial_hold_days', 'hold_countdown'):
+        return np.int8 if max(horizons) <= np.iinfo(np.int8).max else np.int16
+    return np.float32
+
+
+def memory_report(df, compact_df):
+    '''
+    Compare a DataFrame with its compact schema version column by column.
+
+    Input:
+        - df: DataFrame built with the default dtypes
+        - compact_df: the same DataFrame built with compact=True
+
+    Return: DataFrame with the bytes of each column, the bytes saved and the largest difference
+            in values (the number of mismatched labels for decision)
+    '''
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'compact_dtype': compact_df.dtypes.astype(str),
+        'bytes': df.memory_usage(deep=True, index=False),
+        'compact_bytes': compact_df.memory_usage(deep=True, index=False)
+    })
+    report['bytes_saved'] = report['bytes'] - report['compact_bytes']
+
+    difference = {}
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]):
+            difference[column] = float(np.max(np.abs(df[column].to_numpy(dtype=np.float64) - compact_df[column].to_numpy(dtype=np.float64)), initial=0))
+        else:
+            difference[column] = float((df[column].astype(str) != compact_df[column].astype(str)).sum())
+    report['max_difference'] = pd.Series(difference)
+
+    return report
+
+def yf_fetcher(symbols, start_date, end_date):
+    '''
+    Download the adjusted close and volume of every symbol in a single yfinance batch,
+    which yfinance requests concurrently.
+
+    Input:
+        - symbols: list of ticker symbols
+        - start_date: string date in the format of yyyy-mm-dd for the start date of the data pull
+        - end_date: string date in the format of yyyy-mm-dd for the end date of the data pull
+
+    Return: dictionary of symbol to DataFrame with Adj Close and Volume columns, symbols without data are left out
+    '''
+    data = yf.download(list(symbols), start=start_date, end=end_date, group_by='ticker',
+                       auto_adjust=False, threads=True, progress=False)
+
+    # older yfinance versions return flat columns when a single symbol is requested
+    if not isinstance(data.columns, pd.MultiIndex):
+        data = pd.concat({symbols[0]: data}, axis=1)
+
+    prices = {}
+    for symbol in symbols:
+        if symbol not in data.columns.get_level_values(0):
+            continue
+
+        # the batch is aligned on the union of dates, keep only the days this symbol traded
+        price = data[symbol][['Adj Close', 'Volume']].dropna(how='all')
+        if not price.empty:
+            prices[symbol] = price
+
+    return prices
+
+
+def csv_fetcher(directory):
+    '''
+    Build a fetcher that reads prices from local {symbol}.csv files instead of the network,
+    used for offline runs and tests. Each file needs a Date column along with Adj Close and Volume.
+
+    Input:
+        - directory: folder containing one csv file per symbol
+
+    Return: fetcher function with the same signature as yf_fetcher
+    '''
+    def fetcher(symbols, start_date, end_date):
+        prices = {}
+        for symbol in symbols:
+            path = os.path.join(directory, f'{symbol}.csv')
+            if not os.path.exists(path):
+                continue
+
+            price = pd.read_csv(path, index_col='Date', parse_dates=True)[['Adj Close', 'Volume']]
+
+            # end date is exclusive to match yfinance
+            prices[symbol] = price[(price.index >= start_date) & (price.index < end_date)]
+
+        return prices
+
+    return fetcher
+
+
+def _read_cache(cache_dir, symbol):
+    '''
+    Read the cached prices of a symbol along with the (start, end) date range already fetched.
+
+    Return: DataFrame and coverage tuple, or None and None when the symbol is not cached
+    '''
+    import pyarrow.parquet as pq
+
+    path = os.path.join(cache_dir, f'{symbol}.parquet')
+    if not os.path.exists(path):
+        return None, None
+
+    table = pq.read_table(path)
+    coverage = tuple(json.loads(table.schema.metadata[b'coverage']))
+
+    return table.to_pandas(), coverage
+
+
+def _write_cache(cache_dir, symbol, price, coverage):
+    '''
+    Atomically write the prices of a symbol to the cache. The file is written to a temporary
+    path first and moved into place so concurrent runs never read a partial file.
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(cache_dir, exist_ok=True)
+    table = pa.Table.from_pandas(price)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'coverage': json.dumps(coverage).encode()})
+
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(cache_dir, f'{symbol}.parquet'))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def cached_fetcher(cache_dir, fetcher=yf_fetcher, offline=False):
     '''
-    # fetching daily adjusted close price, volume, and percent changes
-    equity_price = yf.download(ticker_symbol, start=start_date, end=end_date, group_by='ticker')[['Adj Close', 'Volume']]
-    equity_price[f'{ticker_symbol}_ret'] = equity_price['Adj Close'].pct_change()
-    equity_price.rename(columns={'Adj Close': f'{ticker_symbol}_close', 'Volume': f'{ticker_symbol}_volume'}, inplace=True)
+    Wrap a fetcher with an incremental on-disk cache holding one parquet file per symbol.
+    Only the dates outside of what was already fetched for a symbol are requested, and the
+    new rows are appended to the cache. Requires pyarrow.
+
+    Note that adjusted closes already in the cache are not revised after new dividends or
+    splits, clear the cache directory to pull a fresh history.
+
+    Input:
+        - cache_dir: folder holding the cached parquet files
+        - fetcher: function used for the dates missing from the cache, see fetch_prices
+        - offline: boolean if True then prices are served entirely from the cache without any download
 
-    tbf_price = pd.DataFrame(yf.download('TBF', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    tbf_price['tbf_ret'] = tbf_price['Adj Close'].pct_change()
-    tbf_price.rename(columns={'Adj Close': 'tbf_close', 'Volume': 'tbf_volume'}, inplace=True)
+    Return: fetcher function with the same signature as yf_fetcher
+    '''
+    def fetch(symbols, start_date, end_date):
+        cached = {}
+        missing_ranges = {}
+
+        for symbol in symbols:
+            price, coverage = _read_cache(cache_dir, symbol)
+            cached[symbol] = (price, coverage)
+
+            if offline:
+                continue
+
+            if coverage is None:
+                missing_ranges.setdefault((start_date, end_date), []).append(symbol)
+                continue
+
+            # coverage stays one contiguous range, any gap up to the request is filled on the way
+            if pd.Timestamp(start_date) < pd.Timestamp(coverage[0]):
+                missing_ranges.setdefault((start_date, coverage[0]), []).append(symbol)
+            if pd.Timestamp(end_date) > pd.Timestamp(coverage[1]):
+                missing_ranges.setdefault((coverage[1], end_date), []).append(symbol)
+
+        # symbols missing the same dates, e.g. the last day of a nightly refresh, share one batch
+        for (range_start, range_end), range_symbols in missing_ranges.items():
+            fetched = fetcher(range_symbols, range_start, range_end)
+
+            for symbol, new_price in fetched.items():
+                if new_price is None or new_price.empty:
+                    # nothing was returned, the range stays missing and is asked for again next time
+                    continue
+
+                # the range only counts as fetched up to the last returned bar, a bar that is not
+                # published yet (e.g. today's close) is asked for again on the next run
+                fetched_end = (new_price.index.max().normalize() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+                fetched_end = min(range_end, fetched_end, key=pd.Timestamp)
+
+                price, coverage = cached[symbol]
+                if price is None:
+                    price, coverage = new_price, (range_start, fetched_end)
+                else:
+                    price = pd.concat([price, new_price])
+                    price = price[~price.index.duplicated(keep='last')].sort_index()
+                    coverage = (min(coverage[0], range_start, key=pd.Timestamp),
+                                max(coverage[1], fetched_end, key=pd.Timestamp))
 
-    tip_price = pd.DataFrame(yf.download('TIP', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    tip_price['tip_ret'] = tip_price['Adj Close'].pct_change()
-    tip_price.rename(columns={'Adj Close': 'tip_close', 'Volume': 'tip_volume'}, inplace=True)
+                _write_cache(cache_dir, symbol, price, coverage)
+                cached[symbol] = (price, coverage)
 
-    uup_price = pd.DataFrame(yf.download('UUP', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    uup_price['uup_ret'] = uup_price['Adj Close'].pct_change()
-    uup_price.rename(columns={'Adj Close': 'uup_close', 'Volume': 'uup_volume'}, inplace=True)
+        prices = {}
+        for symbol, (price, coverage) in cached.items():
+            if price is not None:
+                # end date is exclusive to match yfinance
+                prices[symbol] = price[(price.index >= start_date) & (price.index < end_date)]
 
-    vixy_price = pd.DataFrame(yf.download('VIXY', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    vixy_price['vixy_ret'] = vixy_price['Adj Close'].pct_change()
-    vixy_price.rename(columns={'Adj Close': 'vixy_close', 'Volume': 'vixy_volume'}, inplace=True)
+        return prices
 
-    uso_price = pd.DataFrame(yf.download('USO', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    uso_price['uso_ret'] = uso_price['Adj Close'].pct_change()
-    uso_price.rename(columns={'Adj Close': 'uso_close', 'Volume': 'uso_volume'}, inplace=True)
+    return fetch
 
-    gld_price = pd.DataFrame(yf.download('GLD', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    gld_price['gld_ret'] = gld_price['Adj Close'].pct_change()
-    gld_price.rename(columns={'Adj Close': 'gld_close', 'Volume': 'gld_volume'}, inplace=True)
 
+@instrument('download')
+def fetch_prices(symbols, start_date, end_date, fetcher=yf_fetcher, retries=3, backoff=1.0, allow_missing=False):
+    '''
+    Fetch all symbols in one batch, retrying only the symbols that came back empty
+    with exponential backoff between attempts.
+
+    Input:
+        - symbols: list of ticker symbols
+        - start_date: string date in the format of yyyy-mm-dd for the start date of the data pull
+        - end_date: string date in the format of yyyy-mm-dd for the end date of the data pull
+        - fetcher: function taking (symbols, start_date, end_date) and returning a dictionary of symbol to DataFrame
+        - retries: number of attempts before giving up
+        - backoff: seconds to wait after the first failed attempt, doubled after every attempt
+        - allow_missing: boolean if True then symbols still missing after the last attempt are left out instead of raising
+
+    Return: dictionary of symbol to DataFrame with Adj Close and Volume columns
+    '''
+    prices = {}
+    missing = list(dict.fromkeys(symbols))
+
+    for attempt in range(retries):
+        try:
+            prices.update(fetcher(missing, start_date, end_date))
+        except Exception as error:
+            print(f'price fetch attempt {attempt + 1} failed: {error}')
+
+        missing = [symbol for symbol in missing if symbol not in prices or prices[symbol].empty]
+        if not missing:
+            return prices
+
+        if attempt < retries - 1:
+            time.sleep(backoff * 2 ** attempt)
+
+    if allow_missing:
+        return {symbol: price for symbol, price in prices.items() if not price.empty}
+
+    raise ValueError(f'no price data returned for {missing} after {retries} attempts')
+
+
+def _price_frame(price, prefix, compact=False):
+    '''
+    Build the close, volume and percent change columns of one symbol, named {prefix}_close,
+    {prefix}_volume and {prefix}_ret.
+
+    Input:
+        - price: DataFrame with Adj Close and Volume columns
+        - prefix: string used in front of the column names
+        - compact: boolean if True then the columns are stored as float32
+
+    Return: DataFrame of the symbol close, volume and returns indexed by date
+    '''
+    dtype = np.float32 if compact else None
+    close = price['Adj Close']
+
+    return pd.DataFrame({
+        f'{prefix}_close': close.astype(dtype) if compact else close,
+        f'{prefix}_volume': price['Volume'].astype(dtype) if compact else price['Volume'],
+        f'{prefix}_ret': close.pct_change().astype(dtype) if compact else close.pct_change()
+    })
+
+
+@instrument('join')
+def _join_prices(frames, join='inner'):
+    '''
+    Join the per symbol frames on the date index in a single pass.
+
+    Input:
+        - frames: list of DataFrames from _price_frame (or already joined frames)
+        - join: 'inner' keeps the dates every symbol traded, 'outer' keeps all dates with NaN gaps,
+          'ffill' keeps all dates and carries the last close forward with zero volume and return on the gap days
+
+    Return: DataFrame of all symbols indexed by date
+    '''
+    if join not in ('inner', 'outer', 'ffill'):
+        raise ValueError(f"join must be 'inner', 'outer' or 'ffill', got {join!r}")
+
+    df = pd.concat(frames, axis=1, join='inner' if join == 'inner' else 'outer')
+
+    if join == 'ffill':
+        for close in [col for col in df.columns if col.endswith('_close')]:
+            prefix = close[:-len('_close')]
+
+            # only fill the gaps once the symbol started trading
+            traded = df[close].notna().cummax()
+            df[close] = df[close].ffill()
+            for col in (f'{prefix}_volume', f'{prefix}_ret'):
+                df.loc[traded & df[col].isna(), col] = 0
+
+    return df
+
+
+def _macro_frame(prices, macro_symbols=MACRO_SYMBOLS, join='inner', compact=False):
+    '''
+    Join the macro ETF prices into a single DataFrame indexed by date, shared by every ticker.
+    Columns are named after the lower case symbol, e.g. tbf_close, tbf_volume and tbf_ret.
+
+    Input:
+        - prices: dictionary of symbol to DataFrame from fetch_prices
+        - macro_symbols: sequence of macro ETF symbols
+        - join: join semantics on the date index, see _join_prices
+        - compact: boolean if True then the columns are stored as float32
+
+    Return: DataFrame of macro ETF close, volume and returns
+    '''
+    frames = [_price_frame(prices[symbol], symbol.lower(), compact=compact) for symbol in macro_symbols]
+
+    return _join_prices(frames, join=join)
+
+
+def macro_data_upload(start_date, end_date, fetcher=yf_fetcher, macro_symbols=MACRO_SYMBOLS, join='inner', compact=False):
+    '''
+    Upload the macro ETF data once so it can be joined onto many tickers.
+
+    Input:
+        - start_date: string date in the format of yyyy-mm-dd for the start date of the data pull
+        - end_date: string date in the format of yyyy-mm-dd for the end date of the data pull
+        - fetcher: function used to download the prices, see fetch_prices
+        - macro_symbols: sequence of macro ETF symbols
+        - join: join semantics on the date index, see _join_prices
+        - compact: boolean if True then the columns are stored as float32
+
+    Return: DataFrame of macro ETF close, volume and returns indexed by date
+    '''
+    prices = fetch_prices(list(macro_symbols), start_date, end_date, fetcher=fetcher)
+
+    return _macro_frame(prices, macro_symbols, join=join, compact=compact)
+
+
+def _join_equity_macro(price, ticker_symbol, macro_frames, join='inner', compact=False):
+    '''
+    Join the equity prices with the macro ETF frames in a single pass.
+
+    Return: DataFrame of historical stock price data with a Date column
+    '''
     # joining all data into a single dataframe according to the index (date)
-    df = pd.merge(equity_price, tbf_price, left_index=True, right_index=True)
-    df = pd.merge(df, tip_price, left_index=True, right_index=True)
-    df = pd.merge(df, uup_price, left_index=True, right_index=True)
-    df = pd.merge(df, vixy_price, left_index=True, right_index=True)
-    df = pd.merge(df, uso_price, left_index=True, right_index=True)
-    df = pd.merge(df, gld_price, left_index=True, right_index=True)
+    df = _join_prices([_price_frame(price, ticker_symbol, compact=compact), *macro_frames], join=join)
     df.reset_index(inplace=True)
 
     return df
 
 
-def feature_engineering(df, ticker_symbol):
+def yf_data_upload(start_date, end_date, ticker_symbol, fetcher=yf_fetcher, macro_df=None,
+                   macro_symbols=MACRO_SYMBOLS, join='inner', compact=False):
+    '''
+    Call the yfinance and upload the required data. For our data requirements
+    we will choose a start date of 2010-12-31 and an end date of 2024-02-29.
+
+    Input:
+        - start: string date in the format of yyyy-dd-mm for the start date of the data putll
+        - end: string date in the format of yyyy-dd-mm for the end date of the data pull
+        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - fetcher: function used to download the prices, see fetch_prices
+        - macro_df: DataFrame from macro_data_upload, if given then only the ticker is downloaded
+        - macro_symbols: sequence of macro ETF symbols joined onto the ticker when macro_df is not given
+        - join: join semantics on the date index, see _join_prices
+        - compact: boolean if True then the price columns are stored as float32, see compact_dtype
+    
+    return: DataFrame of historical stock price data
+    '''
+    if macro_df is None:
+        # fetching daily adjusted close price and volume for the ticker and the macro ETFs in one round trip
+        prices = fetch_prices([ticker_symbol, *macro_symbols], start_date, end_date, fetcher=fetcher)
+        frames = [_price_frame(prices[symbol], symbol.lower(), compact=compact) for symbol in macro_symbols]
+    else:
+        prices = fetch_prices([ticker_symbol], start_date, end_date, fetcher=fetcher)
+        frames = [macro_df]
+
+    return _join_equity_macro(prices[ticker_symbol], ticker_symbol, frames, join=join, compact=compact)
+
+
+@instrument('indicators')
+def feature_engineering(df, ticker_symbol, compact=False):
     '''
     Creating required features that are fundamental in the investment process.
 
     Inputs:
         - DataFrame of historical stock price data.
         - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - compact: boolean if True then the indicators are computed in float64 and stored as float32
 
     Return: DataFrame containing additional engineered features.
     '''
+    dtype = np.float32 if compact else np.float64
+    close = df[f'{ticker_symbol}_close'].astype(np.float64)
+
     # feature engineering {ticker_symbol} technical indicator data
     # 35-day EMA
-    df[f'{ticker_symbol}_35_day_ema'] = df[f'{ticker_symbol}_close'].ewm(span=35, adjust=False).mean()
+    df[f'{ticker_symbol}_35_day_ema'] = close.ewm(span=35, adjust=False).mean().astype(dtype)
 
     # Calculate 200-day SMA
-    df[f'{ticker_symbol}_200_day_sma'] = df[f'{ticker_symbol}_close'].rolling(window=200).mean()
+    df[f'{ticker_symbol}_200_day_sma'] = close.rolling(window=200).mean().astype(dtype)
 
     # Calculate MACD and MACD signal
-    df[f'{ticker_symbol}_macd'] = df[f'{ticker_symbol}_close'].ewm(span=12, adjust=False).mean() - df[f'{ticker_symbol}_close'].ewm(span=26, adjust=False).mean()
-    df[f'{ticker_symbol}_macd_signal'] = df[f'{ticker_symbol}_macd'].ewm(span=9, adjust=False).mean()
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    df[f'{ticker_symbol}_macd'] = macd.astype(dtype)
+    df[f'{ticker_symbol}_macd_signal'] = macd.ewm(span=9, adjust=False).mean().astype(dtype)
 
     # Calculate RSI
-    delta = df[f'{ticker_symbol}_close'].diff()
+    delta = close.diff()
     gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
     loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
     rs = gain / loss
-    df[f'{ticker_symbol}_rsi'] = 100 - (100 / (1 + rs))
+    df[f'{ticker_symbol}_rsi'] = (100 - (100 / (1 + rs))).astype(dtype)
     df.fillna(0, inplace=True)
     
     return df
 
 
-def simulate_ret(df, ticker_symbol):
+def forward_return_matrix(close, horizons=HOLD_HORIZONS):
+    '''
+    Compute the forward return of every row for each of the hold horizons in one pass.
+
+    Input:
+        - close: array of closing prices
+        - horizons: sequence of integer hold periods (in days)
+
+    Return: 2D array of shape (len(close), len(horizons)), rows without enough future data are NaN
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    fwd = np.full((n, len(horizons)), np.nan)
+
+    for col, days in enumerate(horizons):
+        if days < n:
+            fwd[:n - days, col] = (close[days:] / close[:n - days]) - 1
+
+    return fwd
+
+
+def _first_extreme(fwd, largest):
+    '''
+    Column position of the max (or min) value of each row, keeping the first column on ties
+    the same way max()/min() over the hold_dict did.
+    '''
+    best = fwd[:, 0].copy()
+    best_col = np.zeros(len(fwd), dtype=np.int64)
+
+    for col in range(1, fwd.shape[1]):
+        better = fwd[:, col] > best if largest else fwd[:, col] < best
+        best[better] = fwd[better, col]
+        best_col[better] = col
+
+    return best_col
+
+
+def _hold_arrays(n, end, points):
+    '''
+    Fill the decision, position and hold columns from the decision points of a strategy. Every point
+    holds its side until the next one, the rows from end on just hold the last position.
+
+    Input:
+        - n: integer number of rows
+        - end: integer first row without a full set of future prices
+        - points: list of (row, side, days to hold) tuples in row order, side 1 for long and -1 for short
+
+    Return: decision codes, position, initial_hold_days and hold_countdown arrays
+    '''
+    decision = np.full(n, DECISION_HOLD, dtype=np.int8)
+    position = np.ones(n, dtype=np.int8)
+    initial_hold_days = np.ones(n, dtype=np.int64)
+    hold_countdown = np.ones(n, dtype=np.int64)
+
+    # decision day 0 as long as entry into the market
+    decision[0] = DECISION_LONG
+
+    if points:
+        rows, sides, days = np.array(points, dtype=np.int64).T
+        decision[rows] = np.where(sides == 1, DECISION_LONG, DECISION_SHORT)
+
+        # every row up to end belongs to the hold period of the last decision point at or before it,
+        # the decision day itself is finished in the position held coming into it
+        tail = max(end, 1)
+        idx = np.arange(rows[0], tail)
+        current = np.searchsorted(rows, idx, side='right') - 1
+        previous = np.searchsorted(rows, idx, side='left') - 1
+        position[idx] = np.where(previous >= 0, sides[np.maximum(previous, 0)], 1)
+        initial_hold_days[idx] = days[current]
+        hold_countdown[idx] = days[current] - (idx - rows[current])
+
+        if tail < len(position):
+            position[tail:] = sides[-1]
+            initial_hold_days[tail:] = initial_hold_days[tail - 1]
+            hold_countdown[tail:] = 0
+
+    return decision, position, initial_hold_days, hold_countdown
+
+
+def _cash_arrays(close, ret, position, cost_rows=None, cost=0.):
+    '''
+    Cash and return on cash of following a position, starting from the first close.
+
+    Input:
+        - close: array of closing prices
+        - ret: array of daily returns
+        - position: array of 1 (long) or -1 (short) held on every row
+        - cost_rows: optional array of rows paying the transaction cost
+        - cost: fraction of cash paid on every cost row
+
+    Return: cash and cash_ret arrays
+    '''
+    # cash compounds the daily return, inverted while short
+    growth = 1 + (position * ret)
+    growth[0] = close[0]
+    if cost_rows is not None and cost:
+        growth[cost_rows] *= 1 - cost
+    cash = np.multiply.accumulate(growth)
+
+    cash_ret = np.empty(len(cash))
+    cash_ret[0] = ret[0]
+    cash_ret[1:] = (cash[1:] / cash[:-1]) - 1
+
+    return cash, cash_ret
+
+
+def _simulate_ret_arrays(close, ret, horizons=HOLD_HORIZONS, fwd=None):
+    '''
+    Array engine behind simulate_ret. Runs the long/short/hold state machine
+    only over decision points and fills every hold period as a slice.
+
+    Input:
+        - close: array of closing prices
+        - ret: array of daily returns
+        - horizons: sequence of integer hold periods (in days)
+        - fwd: optional forward_return_matrix of close and horizons, computed when not given
+
+    Return: decision codes, cash, cash_ret, initial_hold_days and hold_countdown arrays
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    ret = np.asarray(ret, dtype=np.float64)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    n = len(close)
+
+    # future returns are only needed to pick the position and hold days at decision points
+    if fwd is None:
+        fwd = forward_return_matrix(close, horizons)
+    all_negative = np.all(fwd < 0, axis=1)
+    long_days = horizons[_first_extreme(fwd, largest=True)]
+    short_days = horizons[_first_extreme(fwd, largest=False)]
+
+    # the last rows without a full set of future prices just hold the current position
+    end = n - horizons.max()
+    points = []
+    idx = 1
+
+    while idx < end:
+        if all_negative[idx]:
+            points.append((idx, -1, short_days[idx]))
+            idx += short_days[idx]
+        else:
+            points.append((idx, 1, long_days[idx]))
+            idx += long_days[idx]
+
+    decision, position, initial_hold_days, hold_countdown = _hold_arrays(n, end, points)
+    cash, cash_ret = _cash_arrays(close, ret, position)
+
+    return decision, cash, cash_ret, initial_hold_days, hold_countdown
+
+
+def _optimal_points(ret, horizons=HOLD_HORIZONS, cost=0.):
+    '''
+    Dynamic program behind simulate_optimal_ret. Every decision point picks a side and a number of
+    days to hold from horizons, the next decision point follows after those days. The sequence with
+    the largest final cash is found in one pass over the rows, keeping for every row and side the best
+    log cash of a hold period ending there. Runs in O(rows x horizons). Every row depends on the rows
+    one hold period before it, so the pass is sequential and done in Python on purpose, reading the
+    earlier rows through one iterator per horizon instead of slicing them; about 3 s per million rows.
+
+    Input:
+        - ret: array of daily returns
+        - horizons: sequence of integer hold periods (in days)
+        - cost: fraction of cash paid every time the position switches between long and short
+
+    Return: list of (row, side, days to hold) decision points, see _hold_arrays
+    '''
+    n = len(ret)
+    horizons = [int(days) for days in horizons]
+    end = n - max(horizons)
+    if end <= 1:
+        return []
+
+    # log growth of holding long or short summed up to every row, a hold period is two lookups
+    tiny = np.finfo(np.float64).tiny
+    prefix_long = np.concatenate(([0.], np.cumsum(np.log(np.maximum(1 + ret, tiny))))).tolist()
+    prefix_short = np.concatenate(([0.], np.cumsum(np.log(np.maximum(1 - ret, tiny))))).tolist()
+    switch = np.log1p(-cost) if cost < 1 else -np.inf
+    neg = -np.inf
+
+    # best log cash of entering a side at a decision row, less the prefix sum through that row.
+    # the value of row t is stored at t + max(horizons), so the rows before row 0 read as never entered
+    window = max(horizons)
+    offsets = [window - days for days in horizons]
+    # day 0 and the first decision day are held long
+    enter_long = [neg] * (window + 1) + [-prefix_long[2]]
+    enter_short = [neg] * (window + 1) + [switch - prefix_short[2]]
+    # whether entering a side at a decision row switched from the other side
+    switch_long = bytearray(end)
+    switch_short = bytearray(end)
+    switch_short[1] = 1
+
+    # one iterator per horizon over the growing lists, the k values of row t are the entries
+    # days rows before it, which are always appended by the time they are read
+    from_long = zip(*(islice(enter_long, offset + 2, None) for offset in offsets))
+    from_short = zip(*(islice(enter_short, offset + 2, None) for offset in offsets))
+
+    for t, cum_long, cum_short, entries_long, entries_short in zip(
+            range(2, end), prefix_long[3:], prefix_short[3:], from_long, from_short):
+        in_long = cum_long + max(entries_long)
+        in_short = cum_short + max(entries_short)
+
+        if in_short + switch > in_long:
+            enter_long.append(in_short + switch - cum_long)
+            switch_long[t] = 1
+        else:
+            enter_long.append(in_long - cum_long)
+
+        if in_long + switch > in_short:
+            enter_short.append(in_long + switch - cum_short)
+            switch_short[t] = 1
+        else:
+            enter_short.append(in_short - cum_short)
+
+    # the last decision point holds its side through the end of the data
+    first_last = max(end - window, 1)
+    enter_long = np.asarray(enter_long)
+    enter_short = np.asarray(enter_short)
+    final_long = enter_long[first_last + window:] + prefix_long[n]
+    final_short = enter_short[first_last + window:] + prefix_short[n]
+    if final_short.max() > final_long.max():
+        d, side = first_last + int(final_short.argmax()), -1
+    else:
+        d, side = first_last + int(final_long.argmax()), 1
+    days = next(days for days in horizons if d + days >= end)
+
+    # the hold taken into every row and side is the first horizon with the largest entry, looked up
+    # for all rows at once so the walk back through the hold periods is plain indexing
+    held_long = sliding_window_view(enter_long, window)[:end, offsets].argmax(axis=1).tolist()
+    held_short = sliding_window_view(enter_short, window)[:end, offsets].argmax(axis=1).tolist()
+
+    points = [(d, side, days)]
+    while d > 1:
+        if side == 1:
+            side = -1 if switch_long[d] else 1
+        else:
+            side = 1 if switch_short[d] else -1
+        days = horizons[held_long[d] if side == 1 else held_short[d]]
+        d -= days
+        points.append((d, side, days))
+
+    return points[::-1]
+
+
+@instrument('labels')
+def build_future_labels(df, ticker_symbol, horizons=HOLD_HORIZONS, include_returns=False, compact=False):
+    '''
+    Create the future close (and optionally future return) label columns for any set of horizons
+    in one vectorized pass. The last max(horizons) rows have no complete future and are set to 0.
+
+    Input:
+        - df: DataFrame containing all stock price data.
+        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - horizons: sequence of integer number of days ahead
+        - include_returns: boolean if True then {ticker_symbol}_{days}_day_ret columns are added after the close columns
+        - compact: boolean if True then the labels are stored as float32
+
+    Return: df DataFrame with the {ticker_symbol}_{days}_day_close label columns
+    '''
+    close = df[f'{ticker_symbol}_close'].to_numpy(dtype=np.float64)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    n = len(close)
+    last = max(n - horizons.max(), 0)
+
+    # gather every future close at once, rows x horizons
+    future_close = np.zeros((n, len(horizons)), dtype=np.float32 if compact else np.float64)
+    future_close[:last] = close[np.arange(last)[:, None] + horizons]
+
+    for col, days in enumerate(horizons):
+        df[f'{ticker_symbol}_{days}_day_close'] = future_close[:, col]
+
+    if include_returns:
+        future_ret = np.zeros((n, len(horizons)), dtype=future_close.dtype)
+        future_ret[:last] = (close[np.arange(last)[:, None] + horizons] / close[:last, None]) - 1
+
+        for col, days in enumerate(horizons):
+            df[f'{ticker_symbol}_{days}_day_ret'] = future_ret[:, col]
+
+    return df
+
+
+@instrument('simulation')
+def simulate_ret(df, ticker_symbol, horizons=HOLD_HORIZONS, compact=False):
     '''
     Simulate the perfect investment strategy with already knowing future equity prices.
 
     Input:
         - df: DataFrame containing all stock price data.
         - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - horizons: sequence of integer hold periods (in days) to choose from, also used for the future close labels
+        - compact: boolean if True then the new columns are built with the compact schema, see compact_dtype
+
+    Return: df DataFrame with the simulated returns and dependent variables.
+    '''
+    arrays = _simulate_ret_arrays(
+        df[f'{ticker_symbol}_close'].to_numpy(dtype=np.float64),
+        df[f'{ticker_symbol}_ret'].to_numpy(dtype=np.float64),
+        horizons
+    )
+
+    return _simulation_frame(df, ticker_symbol, arrays, horizons, compact)
+
+
+@instrument('simulation')
+def simulate_optimal_ret(df, ticker_symbol, horizons=HOLD_HORIZONS, cost=0., compact=False):
+    '''
+    Simulate the best possible investment strategy with already knowing future equity prices. Unlike
+    simulate_ret, which greedily takes the best hold period at every decision point, the whole sequence
+    of long and short positions is chosen by dynamic programming to end with the most cash. Every
+    position is held for one of the horizons, so they work as minimum holds, and every switch between
+    long and short pays the transaction cost. Returns the same columns as simulate_ret.
+
+    Input:
+        - df: DataFrame containing all stock price data.
+        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - horizons: sequence of integer hold periods (in days) to choose from, also used for the future close labels
+        - cost: fraction of cash paid every time the position switches between long and short
+        - compact: boolean if True then the new columns are built with the compact schema, see compact_dtype
 
     Return: df DataFrame with the simulated returns and dependent variables.
     '''
+    close = df[f'{ticker_symbol}_close'].to_numpy(dtype=np.float64)
+    ret = df[f'{ticker_symbol}_ret'].to_numpy(dtype=np.float64)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    end = len(close) - horizons.max()
+
+    decision, position, initial_hold_days, hold_countdown = _hold_arrays(
+        len(close), end, _optimal_points(ret, horizons, cost)
+    )
+
+    # the switch is traded at the close of the decision day
+    cost_rows = np.flatnonzero(np.diff(position) != 0)
+    cash, cash_ret = _cash_arrays(close, ret, position, cost_rows, cost)
+
+    arrays = (decision, cash, cash_ret, initial_hold_days, hold_countdown)
+    return _simulation_frame(df, ticker_symbol, arrays, horizons, compact)
+
+
+def _simulation_frame(df, ticker_symbol, arrays, horizons=HOLD_HORIZONS, compact=False):
+    '''
+    Add the simulated strategy columns and the future close labels to the DataFrame and trim the
+    rows before the 200 day moving average and after the last future price.
+
+    Input:
+        - df: DataFrame containing all stock price data.
+        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - arrays: tuple of decision codes, cash, cash_ret, initial_hold_days and hold_countdown arrays
+        - horizons: sequence of integer hold periods (in days), also used for the future close labels
+        - compact: boolean if True then the new columns are built with the compact schema, see compact_dtype
+
+    Return: df DataFrame with the simulated returns and dependent variables.
+    '''
+    decision, cash, cash_ret, initial_hold_days, hold_countdown = arrays
 
     # buy, sell, hold decision variable
-    df['decision'] = ''
+    if compact:
+        df['decision'] = pd.Categorical.from_codes(decision, dtype=compact_dtype('decision'))
+    else:
+        df['decision'] = DECISION_LABELS[decision]
 
     # simulating cash position set to the starting price of {ticker_symbol}
-    df['cash'] = df[f'{ticker_symbol}_close'][0]
+    df['cash'] = cash.astype(compact_dtype('cash')) if compact else cash
 
     # daily return on cash, significant for shorts and if we need to add cumulative return at any point
-    df['cash_ret'] = df[f'{ticker_symbol}_ret'][0]
+    df['cash_ret'] = cash_ret.astype(compact_dtype('cash_ret')) if compact else cash_ret
 
     # the initial number of days that we are set to hold a security, could be used as categorical at any point
-    df['initial_hold_days'] = 1
+    df['initial_hold_days'] = initial_hold_days.astype(compact_dtype('initial_hold_days', horizons)) if compact else initial_hold_days
 
     # countdown check to be sure code is executing properly
-    df['hold_countdown'] = 1
-
-    # variable we will use as a countdown indicator for updating the iterative algorithm
-    days_to_hold = 0
-
-    # indicating how we will change the return value, either maintaining positive for buy or inverse for shorts
-    hold_type = 'long'
-
-    for idx in range(len(df)):
-        if idx == 0:
-            # decision day 0 as long as entry into the market
-            df['decision'][idx] = 'long'
-
-        elif (idx < len(df)-20) & (idx != 0):
-
-            # reaching the end of the days_to_hold, trigger new hold_dict with future returns
-            if days_to_hold <= 1:
-            
-                # determine how many days to hold for greatest return
-                hold_dict = {
-                    1: (df[f'{ticker_symbol}_close'][idx+1]/df[f'{ticker_symbol}_close'][idx])-1,
-                    3: (df[f'{ticker_symbol}_close'][idx+3]/df[f'{ticker_symbol}_close'][idx])-1,
-                    5: (df[f'{ticker_symbol}_close'][idx+5]/df[f'{ticker_symbol}_close'][idx])-1,
-                    10: (df[f'{ticker_symbol}_close'][idx+10]/df[f'{ticker_symbol}_close'][idx])-1,
-                    20: (df[f'{ticker_symbol}_close'][idx+20]/df[f'{ticker_symbol}_close'][idx])-1
-                }
-
-                # if all future values are negative, short the stock
-                if all(value < 0 for value in hold_dict.values()):
-
-                    # when the initial position is a short, finish the current day as short
-                    if hold_type == 'short':
-                        
-                        df['decision'][idx] = 'short'
-                        days_to_hold = min(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'short'
-
-                    # when the initial position is a long, finish the current day as long
-                    elif hold_type == 'long':
-
-                        df['decision'][idx] = 'short'
-                        days_to_hold = min(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'short'
-
-                else:
-
-                    # go long otherwise
-                    if hold_type == 'short':
-                        # when the initial position is a short, finish the current day as short
-                        df['decision'][idx] = 'long'
-                        days_to_hold = max(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'long'
-                    
-                    elif hold_type == 'long':
-                        # when the initial position is a long, finish the current day as long
-                        df['decision'][idx] = 'long'
-                        days_to_hold = max(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'long'
-
-            elif days_to_hold > 1:
-
-                # when a days_to_hold is decided - continue position until end of the hold days
-                if hold_type == 'long':
-                    df['decision'][idx] = 'hold'
-                    df['cash'][idx] = df['cash'][idx-1]*(1+df[f'{ticker_symbol}_ret'][idx])
-                    df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                    days_to_hold -= 1
-                    df['hold_countdown'][idx] = days_to_hold
-                    df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-                    
-                elif hold_type == 'short':
-                    df['decision'][idx] = 'hold'
-                    df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1)) 
-                    df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                    days_to_hold -= 1
-                    df['hold_countdown'][idx] = days_to_hold
-                    df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-
-        else:
-            # when we get to the end of our dataframe hold our current position (long/short)
-            if hold_type == 'long':
-                df['decision'][idx] = 'hold'
-                df['cash'][idx] = df['cash'][idx-1]*(1+df[f'{ticker_symbol}_ret'][idx])
-                df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                df['hold_countdown'][idx] = 0
-                df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-                
-            elif hold_type == 'short':
-                df['decision'][idx] = 'hold'
-                df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1))
-                df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                df['hold_countdown'][idx] = 0
-                df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-    
-    # create future day close features
-    df[f'{ticker_symbol}_1_day_close'] = 0
-    df[f'{ticker_symbol}_3_day_close'] = 0
-    df[f'{ticker_symbol}_5_day_close'] = 0
-    df[f'{ticker_symbol}_10_day_close'] = 0
-    df[f'{ticker_symbol}_20_day_close'] = 0
+    df['hold_countdown'] = hold_countdown.astype(compact_dtype('hold_countdown', horizons)) if compact else hold_countdown
 
     # document future price values
-    for idx in range(len(df)):
-        if idx <= len(df)-21:
-
-            df[f'{ticker_symbol}_1_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+1]
-            df[f'{ticker_symbol}_3_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+3]
-            df[f'{ticker_symbol}_5_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+5]
-            df[f'{ticker_symbol}_10_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+10]
-            df[f'{ticker_symbol}_20_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+20]
-        
-        else:
-            df[f'{ticker_symbol}_1_day_close'][idx] = 0
-            df[f'{ticker_symbol}_3_day_close'][idx] = 0
-            df[f'{ticker_symbol}_5_day_close'][idx] = 0
-            df[f'{ticker_symbol}_10_day_close'][idx] = 0
-            df[f'{ticker_symbol}_20_day_close'][idx] = 0
-
-    # will only return data that reports the beginning of the 200 day moving average and the last 20 days
-    df = df.iloc[199:-20]
+    df = build_future_labels(df, ticker_symbol, horizons, compact=compact)
+
+    # will only return data that reports the beginning of the 200 day moving average and the last days without a future
+    df = df.iloc[199:-max(horizons)]
     df = df.reset_index(drop=True)
 
     return df
 
 
+def sweep_horizons(df, ticker_symbol, horizon_sets, return_rows=False):
+    '''
+    Evaluate the perfect investment strategy of simulate_ret under many sets of hold horizons.
+    The forward returns are computed once for the union of all horizons and every set reads its
+    columns from that shared matrix. To keep the sets comparable, every set is scored on the
+    same rows, from the first row up to the last row that has a future for the longest horizon.
 
+    Input:
+        - df: DataFrame containing all stock price data.
+        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - horizon_sets: list of sequences of integer hold periods, e.g. [(1, 3, 5, 10, 20), (1, 2, 3, 5, 8, 13, 21)]
+        - return_rows: boolean if True then the per row output of every set is returned as well
 
-def execute_etl(start_date, end_date, ticker_symbol):
+    Return: DataFrame with one row per horizon set holding the final cash, total return, number of
+            decisions, number of long/short switches, turnover (switches per row) and the share of
+            long, short and hold labels. When return_rows is True, also a dictionary of horizon set
+            to a DataFrame with the decision, cash, cash_ret, initial_hold_days and hold_countdown columns
+    '''
+    close = df[f'{ticker_symbol}_close'].to_numpy(dtype=np.float64)
+    ret = df[f'{ticker_symbol}_ret'].to_numpy(dtype=np.float64)
+    horizon_sets = [tuple(int(days) for days in horizons) for horizons in horizon_sets]
+
+    # one forward return matrix shared by every set
+    all_horizons = sorted(set().union(*horizon_sets))
+    column = {days: col for col, days in enumerate(all_horizons)}
+    fwd = forward_return_matrix(close, all_horizons)
+    end = max(len(close) - all_horizons[-1], 1)
+
+    summary = []
+    rows = {}
+    for horizons in horizon_sets:
+        decision, cash, cash_ret, initial_hold_days, hold_countdown = _simulate_ret_arrays(
+            close, ret, horizons, fwd=fwd[:, [column[days] for days in horizons]]
+        )
+
+        # positions taken at every decision point, a switch is a change from long to short or back
+        window = decision[:end]
+        positions = window[window != DECISION_HOLD]
+        switches = int(np.count_nonzero(positions[1:] != positions[:-1]))
+        shares = np.bincount(window, minlength=len(DECISION_LABELS)) / len(window)
+
+        summary.append({
+            'horizons': horizons,
+            'final_cash': cash[end - 1],
+            'total_return': (cash[end - 1] / cash[0]) - 1,
+            'decisions': len(positions),
+            'switches': switches,
+            'turnover': switches / len(window),
+            **{label: shares[code] for code, label in enumerate(DECISION_LABELS)}
+        })
+
+        if return_rows:
+            rows[horizons] = pd.DataFrame({
+                'decision': DECISION_LABELS[decision],
+                'cash': cash,
+                'cash_ret': cash_ret,
+                'initial_hold_days': initial_hold_days,
+                'hold_countdown': hold_countdown
+            }, index=df.index)
+
+    summary = pd.DataFrame(summary)
+
+    return (summary, rows) if return_rows else summary
+
+
+@instrument('execute_etl')
+def execute_etl(start_date, end_date, ticker_symbol, fetcher=yf_fetcher, join='inner', compact=False):
     '''
     Execute the data extraction and features engineering functions
 
@@ -274,11 +915,85 @@ def execute_etl(start_date, end_date, ticker_symbol):
         - start: string date in the format of yyyy-dd-mm for the start date of the data putll
         - end: string date in the format of yyyy-dd-mm for the end date of the data pull
         - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - fetcher: function used to download the prices, see fetch_prices
+        - join: join semantics on the date index, see _join_prices
+        - compact: boolean if True then the columns use the smaller dtypes of compact_dtype
     
     Return: DataFrame of historical stock price data 
     '''
-    df = yf_data_upload(start_date, end_date, ticker_symbol)
-    df = feature_engineering(df, ticker_symbol)
-    df = simulate_ret(df, ticker_symbol)
+    df = yf_data_upload(start_date, end_date, ticker_symbol, fetcher=fetcher, join=join, compact=compact)
+    df = feature_engineering(df, ticker_symbol, compact=compact)
+    df = simulate_ret(df, ticker_symbol, compact=compact)
+
+    return df
+
+
+def _panel_worker(args):
+    '''
+    Run the feature engineering and simulation of a single ticker inside a worker process.
+
+    Return: tuple of ticker symbol, DataFrame (None on failure) and error message (None on success)
+    '''
+    ticker_symbol, df, compact, ticker_dtype = args
+    try:
+        df = feature_engineering(df, ticker_symbol, compact=compact)
+        df = simulate_ret(df, ticker_symbol, compact=compact)
+    except Exception as error:
+        return ticker_symbol, None, f'{type(error).__name__}: {error}'
+
+    # ticker agnostic column names so every ticker stacks into the same columns
+    prefix = f'{ticker_symbol}_'
+    df.columns = [col[len(prefix):] if col.startswith(prefix) else col for col in df.columns]
+    df.insert(0, 'ticker', pd.Series(ticker_symbol, index=df.index, dtype=ticker_dtype))
+
+    return ticker_symbol, df, None
+
+
+def execute_etl_panel(start_date, end_date, ticker_symbols, fetcher=yf_fetcher, max_workers=None, join='inner', compact=False):
+    '''
+    Execute the data extraction and features engineering functions for many tickers. The macro ETFs
+    are downloaded and joined once, and the feature engineering and simulation of every ticker are
+    spread across a process pool.
+
+    Input:
+        - start_date: string date in the format of yyyy-mm-dd for the start date of the data pull
+        - end_date: string date in the format of yyyy-mm-dd for the end date of the data pull
+        - ticker_symbols: list of string values in all caps for the tickers in our analysis
+        - fetcher: function used to download the prices, see fetch_prices
+        - max_workers: number of worker processes, defaults to the number of cpus. 1 runs everything in this process
+        - join: join semantics on the date index, see _join_prices
+        - compact: boolean if True then the columns use the smaller dtypes of compact_dtype and ticker is categorical
+
+    Return: long format DataFrame with a ticker column (ticker prefixes are dropped from the column names),
+            dictionary of ticker symbol to error message for the tickers that failed
+    '''
+    ticker_symbols = list(dict.fromkeys(ticker_symbols))
+    macro_df = macro_data_upload(start_date, end_date, fetcher=fetcher, join=join, compact=compact)
+    prices = fetch_prices(ticker_symbols, start_date, end_date, fetcher=fetcher, allow_missing=True)
+
+    ticker_dtype = pd.CategoricalDtype(ticker_symbols) if compact else object
+    errors = {}
+    jobs = []
+    for ticker_symbol in ticker_symbols:
+        if ticker_symbol not in prices:
+            errors[ticker_symbol] = 'ValueError: no price data returned'
+            continue
+        df = _join_equity_macro(prices[ticker_symbol], ticker_symbol, [macro_df], join=join, compact=compact)
+        jobs.append((ticker_symbol, df, compact, ticker_dtype))
+
+    if max_workers == 1:
+        results = list(map(_panel_worker, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_panel_worker, jobs))
+
+    frames = []
+    for ticker_symbol, df, error in results:
+        if error is None:
+            frames.append(df)
+        else:
+            errors[ticker_symbol] = error
+
+    panel = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
-    return df
\ No newline at end of file
+    return panel, errors
@@ -0,0 +1,176 @@
+"""
+This file contains the opt-in timing and memory instrumentation of
+the data_etl stages. Nothing is recorded unless an EtlProfiler is active.
+
+Usage:
+    with EtlProfiler() as profiler:
+        df = execute_etl('2010-12-31', '2024-02-29', 'TQQQ')
+    profiler.to_json('etl_profile.json')
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+# profiler currently recording, None when instrumentation is disabled
+_active = None
+
+
+def _count_rows(obj):
+    '''
+    Number of rows of a DataFrame or array, or the total over a dictionary or list of them.
+
+    Return: integer number of rows, None when the object holds no tabular data
+    '''
+    if hasattr(obj, 'shape') and len(obj.shape) > 0:
+        return int(obj.shape[0])
+
+    values = list(obj.values()) if isinstance(obj, dict) else obj
+    if isinstance(values, (list, tuple)) and values and all(hasattr(value, 'shape') for value in values):
+        return sum(int(value.shape[0]) for value in values)
+
+    return None
+
+
+class EtlProfiler:
+    '''
+    Records the wall time, rows in and out and peak allocated memory of every instrumented stage
+    run while it is active. Stages can be nested, e.g. execute_etl contains feature_engineering.
+    '''
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._open = []
+        self._previous = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        return False
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        '''
+        Record one stage. The yielded record can be updated inside the block, e.g. with rows_out.
+
+        Input:
+            - name: string name of the stage
+            - rows_in: integer number of rows going into the stage
+        '''
+        record = {'stage': name, 'depth': len(self._open), 'rows_in': rows_in, 'rows_out': None}
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+
+        if tracing:
+            # keep the peak of the stages still open before resetting it for this one
+            current, peak = tracemalloc.get_traced_memory()
+            for open_record in self._open:
+                open_record['_peak'] = max(open_record['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start_memory'] = current
+            record['_peak'] = current
+
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._open.pop()
+
+            if tracing:
+                peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = peak - record.pop('_start_memory')
+            else:
+                record['peak_bytes'] = None
+
+            self.records.append(record)
+
+    def to_frame(self):
+        '''
+        Return: DataFrame with one row per recorded stage in the order the stages finished
+        '''
+        return pd.DataFrame(self.records, columns=['stage', 'depth', 'seconds', 'rows_in', 'rows_out', 'peak_bytes'])
+
+    def to_json(self, path=None):
+        '''
+        Export the recorded stages.
+
+        Input:
+            - path: optional file path the JSON is written to
+
+        Return: JSON string of the recorded stages
+        '''
+        payload = json.dumps(self.records, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(payload)
+
+        return payload
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    '''
+    Record a block of code as a stage of the active profiler, does nothing when none is active.
+
+    Input:
+        - name: string name of the stage
+        - rows_in: integer number of rows going into the stage
+    '''
+    if _active is None:
+        yield {}
+    else:
+        with _active.stage(name, rows_in) as record:
+            yield record
+
+
+def instrument(name):
+    '''
+    Decorator recording every call of a stage function on the active profiler. Rows in are counted
+    from the first argument and rows out from the return value. When no profiler is active the
+    function is called directly.
+
+    Input:
+        - name: string name of the stage
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+
+            with _active.stage(name, _count_rows(args[0]) if args else None) as record:
+                result = func(*args, **kwargs)
+                record['rows_out'] = _count_rows(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
@@ -1,144 +1,308 @@
 '''
 This file contains all necessary code for conducting a simulation
-on returns following the predictions using the developed RNN on 
-TQQQ ETF data. STILL NEED TO CODE THIS SOLUTION OUT.
+on returns following the predictions using the developed RNN on
+TQQQ ETF data. Many models or trials are backtested together, one
+column of predictions per model.
 
 Author: Christian Ruiz, cr72@rice.edu
 Course: COMP 642
 Instructor: Janell Straach
 '''
 
+# import necessary packages
+import json
+import pandas as pd
+import numpy as np
+from data_etl import HOLD_HORIZONS, DECISION_LONG, DECISION_SHORT, DECISION_HOLD, DECISION_LABELS
 
-def simulate_ret(df):
+
+def _predicted_returns(close, predictions, horizons):
+    '''
+    Check the shape of the predictions and turn them into predicted returns.
+
+    Input:
+        - close: array of closing prices
+        - predictions: array of predicted future closes, rows x models x horizons or rows x models for one horizon
+        - horizons: sequence of integer hold periods (in days) the predictions are made for
+
+    Return: array of predicted returns, rows x models x horizons
+    '''
+    predictions = np.asarray(predictions, dtype=np.float64)
+    shape = predictions.shape
+    if predictions.ndim == 2:
+        predictions = predictions[:, :, None]
+
+    if predictions.ndim != 3 or predictions.shape[0] != len(close) or predictions.shape[2] != len(horizons):
+        raise ValueError(f'predictions of shape {shape} do not match {len(close)} rows and {len(horizons)} horizons')
+
+    return (predictions / close[:, None, None]) - 1
+
+
+def _backtest_arrays(close, ret, predictions, horizons=HOLD_HORIZONS):
+    '''
+    Array engine behind backtest and simulate_ret. Every model follows the long/short/hold rules of
+    simulate_ret on its own predictions, all models step through their decision points together.
+
+    Input:
+        - close: array of closing prices
+        - ret: array of daily returns
+        - predictions: array of predicted future closes, rows x models x horizons or rows x models for one horizon
+        - horizons: sequence of integer hold periods (in days) the predictions are made for
+
+    Return: dictionary of rows x models arrays: decision codes, position, initial_hold_days,
+            hold_countdown and cash, and the decision rows, models, sides and hold days
+    '''
+    horizons = np.asarray(horizons, dtype=np.int64)
+    fwd = _predicted_returns(close, predictions, horizons)
+    n, n_models = fwd.shape[:2]
+
+    # side and days to hold each model would pick on every row, argmax/argmin keep the first horizon on ties
+    all_negative = np.all(fwd < 0, axis=2)
+    side = np.where(all_negative, -1, 1).astype(np.int8)
+    days = np.where(all_negative, horizons[np.argmin(fwd, axis=2)], horizons[np.argmax(fwd, axis=2)])
+
+    # the last rows without a full set of future prices just hold the current position
+    end = n - horizons.max()
+    models = np.arange(n_models)
+    is_decision = np.zeros((n, n_models), dtype=bool)
+    current = np.ones(n_models, dtype=np.int64)
+
+    while True:
+        active = current < end
+        if not active.any():
+            break
+        rows = current[active]
+        is_decision[rows, models[active]] = True
+        current[active] += days[rows, models[active]]
+
+    # decision day 0 as long as entry into the market
+    is_decision[0] = True
+    side[0] = 1
+    days[0] = 1
+
+    # last decision row at or before every row
+    last = np.maximum.accumulate(np.where(is_decision, np.arange(n)[:, None], 0), axis=0)
+
+    # the decision day is finished in the position held coming into it
+    position = np.ones((n, n_models), dtype=np.int8)
+    position[1:] = side[last[:-1], models]
+
+    initial_hold_days = days[last, models]
+    hold_countdown = initial_hold_days - (np.arange(n)[:, None] - last)
+    tail = max(end, 1)
+    if tail < n:
+        initial_hold_days[tail:] = initial_hold_days[tail - 1]
+        hold_countdown[tail:] = 0
+
+    decision = np.full((n, n_models), DECISION_HOLD, dtype=np.int8)
+    decision[is_decision] = np.where(side[is_decision] == 1, DECISION_LONG, DECISION_SHORT)
+
+    # cash compounds the daily return, inverted while short
+    growth = 1 + (position * ret[:, None])
+    growth[0] = close[0]
+    cash = np.multiply.accumulate(growth, axis=0)
+
+    decision_rows, decision_models = np.nonzero(is_decision[1:])
+
+    return {
+        'decision': decision,
+        'position': position,
+        'initial_hold_days': initial_hold_days,
+        'hold_countdown': hold_countdown,
+        'cash': cash,
+        'decision_rows': decision_rows + 1,
+        'decision_models': decision_models,
+        'decision_sides': side[decision_rows + 1, decision_models],
+        'decision_days': days[decision_rows + 1, decision_models]
+    }
+
+
+def backtest(close, predictions, horizons=HOLD_HORIZONS, ret=None, model_names=None, return_cash=False):
+    '''
+    Backtest many models or trials on the same prices in one pass. Every model goes long for the
+    horizon with the highest predicted return, or short for the lowest one when all predicted
+    returns are negative, like simulate_ret.
+
+    Input:
+        - close: array of closing prices
+        - predictions: array of predicted future closes, rows x models x horizons or rows x models for one horizon
+        - horizons: sequence of integer hold periods (in days) the predictions are made for
+        - ret: optional array of daily returns, computed from close when not given
+        - model_names: optional list of names of the models, used as the index of the summary
+        - return_cash: boolean if True then the rows x models cash array is returned as well
+
+    Return: DataFrame with one row per model holding the final equity, total return, max drawdown,
+            number of trades (switches between long and short), number of decisions and hit rate
+            (share of decisions whose hold period moved in the chosen direction)
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    if ret is None:
+        ret = np.zeros(len(close))
+        ret[1:] = (close[1:] / close[:-1]) - 1
+    ret = np.asarray(ret, dtype=np.float64)
+
+    arrays = _backtest_arrays(close, ret, predictions, horizons)
+    cash = arrays['cash']
+    n_models = cash.shape[1]
+
+    drawdown = (cash / np.maximum.accumulate(cash, axis=0)) - 1
+    trades = np.count_nonzero(np.diff(arrays['position'], axis=0), axis=0)
+
+    # realized return of every decision over its hold period in the chosen direction
+    rows, models = arrays['decision_rows'], arrays['decision_models']
+    realized = arrays['decision_sides'] * ((close[rows + arrays['decision_days']] / close[rows]) - 1)
+    decisions = np.bincount(models, minlength=n_models)
+    hits = np.bincount(models, weights=realized > 0, minlength=n_models)
+
+    summary = pd.DataFrame({
+        'final_equity': cash[-1],
+        'total_return': (cash[-1] / cash[0]) - 1,
+        'max_drawdown': drawdown.min(axis=0),
+        'trades': trades,
+        'decisions': decisions,
+        'hit_rate': np.divide(hits, decisions, out=np.full(n_models, np.nan), where=decisions > 0)
+    }, index=pd.Index(model_names if model_names is not None else range(n_models), name='model'))
+
+    return (summary, cash) if return_cash else summary
+
+
+def simulate_ret(df, ticker_symbol='tqqq', predictions=None, horizons=HOLD_HORIZONS):
     '''
     Using predicted prices to simulate possible returns.
 
     Input:
-        - df: DataFrame holding the predicted future price data.
-    
+        - df: DataFrame holding the {ticker_symbol}_close and {ticker_symbol}_ret price data.
+        - ticker_symbol: string prefix of the price columns
+        - predictions: array of predicted future closes, rows x horizons, the actual future closes when not given
+        - horizons: sequence of integer hold periods (in days) the predictions are made for
+
     return: DataFrame of simulated returns
     '''
+    close = df[f'{ticker_symbol}_close'].to_numpy(dtype=np.float64)
+    ret = df[f'{ticker_symbol}_ret'].to_numpy(dtype=np.float64)
+    horizons = np.asarray(horizons, dtype=np.int64)
+
+    if predictions is None:
+        # perfect foresight, the future closes that are known
+        future = np.arange(len(close))[:, None] + horizons
+        predictions = close[np.minimum(future, len(close) - 1)]
+    predictions = np.asarray(predictions, dtype=np.float64).reshape(len(close), 1, len(horizons))
+
+    arrays = _backtest_arrays(close, ret, predictions, horizons)
+    cash = arrays['cash'][:, 0]
 
     # buy, sell, hold decision variable
-    df['decision'] = ''
+    df['decision'] = DECISION_LABELS[arrays['decision'][:, 0]]
 
-    # simulating cash position set to the starting price of tqqq
-    df['cash'] = df['tqqq_close'][0]
+    # simulating cash position set to the starting price of {ticker_symbol}
+    df['cash'] = cash
 
     # daily return on cash, significant for shorts and if we need to add cumulative return at any point
-    df['cash_ret'] = df['tqqq_ret'][0]
+    cash_ret = np.empty(len(cash))
+    cash_ret[0] = ret[0]
+    cash_ret[1:] = (cash[1:] / cash[:-1]) - 1
+    df['cash_ret'] = cash_ret
 
     # the initial number of days that we are set to hold a security, could be used as categorical at any point
-    df['initial_hold_days'] = 1
+    df['initial_hold_days'] = arrays['initial_hold_days'][:, 0]
 
     # countdown check to be sure code is executing properly
-    df['hold_countdown'] = 1
+    df['hold_countdown'] = arrays['hold_countdown'][:, 0]
 
-    # variable we will use as a countdown indicator for updating the iterative algorithm
-    days_to_hold = 0
+    return df
 
-    # indicating how we will change the return value, either maintaining positive for buy or inverse for shorts
-    hold_type = 'long'
 
-    for idx in range(len(df)):
-        if idx == 0:
+class LiveStrategy:
+    '''
+    The long/short/hold rules of simulate_ret run one bar at a time. Holds the days left to hold,
+    the position and the cash, so every new bar is decided in constant time. Replaying a history
+    bar by bar, with predictions for the rows simulate_ret decides on and None for its last
+    max(horizons) rows, gives exactly the columns of simulate_ret.
+    '''
+
+    def __init__(self, horizons=HOLD_HORIZONS):
+        self.horizons = np.asarray(horizons, dtype=np.int64)
+        self.days_to_hold = 0
+        self.hold_type = 'long'
+        self.cash = None
+        self.initial_hold_days = 1
+
+    def update(self, close, ret, predictions=None):
+        '''
+        Add the next bar.
+
+        Input:
+            - close: float closing price of the bar
+            - ret: float realized return of the bar
+            - predictions: predicted future closes for every horizon, None when no full forward curve is
+                           available and the position is just held
+
+        Return: dictionary with the decision, cash, cash_ret, initial_hold_days and hold_countdown of the bar
+        '''
+        if self.cash is None:
             # decision day 0 as long as entry into the market
-            df['decision'][idx] = 'long'
-
-        elif (idx < len(df)-20) & (idx != 0):
-
-            # reaching the end of the days_to_hold, trigger new hold_dict with future returns
-            if days_to_hold <= 1:
-            
-                # determine how many days to hold for greatest return
-                hold_dict = {
-                    1: (df['tqqq_close'][idx+1]/df['tqqq_close'][idx])-1,
-                    3: (df['tqqq_close'][idx+3]/df['tqqq_close'][idx])-1,
-                    5: (df['tqqq_close'][idx+5]/df['tqqq_close'][idx])-1,
-                    10: (df['tqqq_close'][idx+10]/df['tqqq_close'][idx])-1,
-                    20: (df['tqqq_close'][idx+20]/df['tqqq_close'][idx])-1
-                }
-
-                # if all future values are negative, short the stock
-                if all(value < 0 for value in hold_dict.values()):
-
-                    # when the initial position is a short, finish the current day as short
-                    if hold_type == 'short':
-                        
-                        df['decision'][idx] = 'short'
-                        days_to_hold = min(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df['tqqq_ret'][idx]*-1))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'short'
-
-                    # when the initial position is a long, finish the current day as long
-                    elif hold_type == 'long':
-
-                        df['decision'][idx] = 'short'
-                        days_to_hold = min(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df['tqqq_ret'][idx]))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'short'
-
-                else:
-
-                    # go long otherwise
-                    if hold_type == 'short':
-                        # when the initial position is a short, finish the current day as short
-                        df['decision'][idx] = 'long'
-                        days_to_hold = max(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df['tqqq_ret'][idx]*-1))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'long'
-                    
-                    elif hold_type == 'long':
-                        # when the initial position is a long, finish the current day as long
-                        df['decision'][idx] = 'long'
-                        days_to_hold = max(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df['tqqq_ret'][idx]))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'long'
-
-            elif days_to_hold > 1:
-
-                # when a days_to_hold is decided - continue position until end of the hold days
-                if hold_type == 'long':
-                    df['decision'][idx] = 'hold'
-                    df['cash'][idx] = df['cash'][idx-1]*(1+df['tqqq_ret'][idx])
-                    df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                    days_to_hold -= 1
-                    df['hold_countdown'][idx] = days_to_hold
-                    df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-                    
-                elif hold_type == 'short':
-                    df['decision'][idx] = 'hold'
-                    df['cash'][idx] = df['cash'][idx-1]*(1+(df['tqqq_ret'][idx]*-1)) 
-                    df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                    days_to_hold -= 1
-                    df['hold_countdown'][idx] = days_to_hold
-                    df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
+            self.cash = float(close)
+            return {'decision': 'long', 'cash': self.cash, 'cash_ret': float(ret),
+                    'initial_hold_days': 1, 'hold_countdown': 1}
+
+        # the bar is finished in the position held coming into it
+        previous_cash = self.cash
+        self.cash = previous_cash * (1 + (ret if self.hold_type == 'long' else -ret))
+        cash_ret = (self.cash / previous_cash) - 1
+
+        if predictions is None:
+            # no full forward curve, hold the current position
+            decision, hold_countdown = 'hold', 0
+
+        elif self.days_to_hold <= 1:
+            # determine how many days to hold for greatest return, short if all future values are negative
+            fwd = (np.asarray(predictions, dtype=np.float64) / close) - 1
+            if np.all(fwd < 0):
+                decision = self.hold_type = 'short'
+                self.days_to_hold = int(self.horizons[np.argmin(fwd)])
+            else:
+                decision = self.hold_type = 'long'
+                self.days_to_hold = int(self.horizons[np.argmax(fwd)])
+            self.initial_hold_days = hold_countdown = self.days_to_hold
 
         else:
-            # when we get to the end of our dataframe hold our current position (long/short)
-            if hold_type == 'long':
-                df['decision'][idx] = 'hold'
-                df['cash'][idx] = df['cash'][idx-1]*(1+df['tqqq_ret'][idx])
-                df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                df['hold_countdown'][idx] = 0
-                df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-                
-            elif hold_type == 'short':
-                df['decision'][idx] = 'hold'
-                df['cash'][idx] = df['cash'][idx-1]*(1+(df['tqqq_ret'][idx]*-1))
-                df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                df['hold_countdown'][idx] = 0
-                df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
+            # continue the position until the end of the hold days
+            decision = 'hold'
+            self.days_to_hold -= 1
+            hold_countdown = self.days_to_hold
+
+        return {'decision': decision, 'cash': self.cash, 'cash_ret': cash_ret,
+                'initial_hold_days': self.initial_hold_days, 'hold_countdown': hold_countdown}
+
+    def to_json(self):
+        '''
+        Serialize the strategy state.
+
+        Return: JSON string of the horizons, days to hold, position, cash and initial hold days
+        '''
+        return json.dumps({
+            'horizons': self.horizons.tolist(),
+            'days_to_hold': self.days_to_hold,
+            'hold_type': self.hold_type,
+            'cash': self.cash,
+            'initial_hold_days': self.initial_hold_days
+        })
+
+    @classmethod
+    def from_json(cls, payload):
+        '''
+        Restore the strategy state saved with to_json.
+
+        Input:
+            - payload: JSON string from to_json
+
+        Return: LiveStrategy continuing from the saved state
+        '''
+        state = json.loads(payload)
+        strategy = cls(state['horizons'])
+        strategy.days_to_hold = state['days_to_hold']
+        strategy.hold_type = state['hold_type']
+        strategy.cash = state['cash']
+        strategy.initial_hold_days = state['initial_hold_days']
 
+        return strategy
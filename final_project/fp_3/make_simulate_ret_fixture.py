@@ -0,0 +1,94 @@
+"""
+This file regenerates fixtures/simulate_ret_baseline.npz, the frozen
+outputs of the original row by row simulate_ret loop that
+test_simulate_ret.py checks the array engine against. The loop is taken
+verbatim from the baseline commit with git and run on synthetic price
+histories, so the reference never changes along with the implementation.
+
+Usage:
+    python final_project/fp_3/make_simulate_ret_fixture.py
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import ast
+import os
+import subprocess
+import warnings
+import pandas as pd
+import numpy as np
+
+# last commit holding the original row by row simulate_ret
+BASELINE = '957f3c0'
+TICKER = 'TQQQ'
+SEEDS = range(12)
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'simulate_ret_baseline.npz')
+
+
+def baseline_simulate_ret():
+    '''
+    Load simulate_ret verbatim from the baseline commit, without importing the rest of its module.
+
+    Return: the original simulate_ret function
+    '''
+    folder = os.path.dirname(os.path.abspath(__file__))
+    source = subprocess.check_output(['git', 'show', f'{BASELINE}:./data_etl.py'], cwd=folder, text=True)
+    node = next(node for node in ast.parse(source).body if isinstance(node, ast.FunctionDef) and node.name == 'simulate_ret')
+
+    namespace = {'pd': pd, 'np': np}
+    exec(ast.get_source_segment(source, node), namespace)
+
+    return namespace['simulate_ret']
+
+
+def synthetic_history(n, seed, flat=False):
+    '''
+    Random walk of closing prices rounded to cents, so equal returns and all negative forward curves occur.
+
+    Input:
+        - n: integer number of rows
+        - seed: integer seed of the random walk
+        - flat: boolean if True then a stretch of equal closes is added to test the ties
+
+    Return: DataFrame with the close, volume and ret columns
+    '''
+    rng = np.random.default_rng(seed)
+    close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    if flat:
+        close[n // 3:n // 2] = close[n // 3]
+    close = np.round(close, 2)
+
+    df = pd.DataFrame({f'{TICKER}_close': close, f'{TICKER}_volume': rng.integers(100000, 1000000, n)})
+    df[f'{TICKER}_ret'] = df[f'{TICKER}_close'].pct_change().fillna(0)
+
+    return df
+
+
+def main():
+    simulate_ret = baseline_simulate_ret()
+    arrays = {}
+
+    # the original loop writes through chained assignment, which warns on every row
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for seed in SEEDS:
+            df = synthetic_history(400 + (seed * 37), seed, flat=seed % 3 == 0)
+            expected = simulate_ret(df.copy(), TICKER)
+
+            for col in df.columns:
+                arrays[f'{seed}/input/{col}'] = df[col].to_numpy()
+            arrays[f'{seed}/columns'] = np.array([str(col) for col in expected.columns])
+            for col in expected.columns:
+                values = expected[col].to_numpy()
+                arrays[f'{seed}/output/{col}'] = values.astype(str) if values.dtype == object else values
+
+    os.makedirs(os.path.dirname(FIXTURE), exist_ok=True)
+    np.savez_compressed(FIXTURE, **arrays)
+    print(f'{FIXTURE}: {len(SEEDS)} histories, {os.path.getsize(FIXTURE)} bytes')
+
+
+if __name__ == '__main__':
+    main()
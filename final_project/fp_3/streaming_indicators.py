@@ -0,0 +1,262 @@
+"""
+This file contains a streaming version of the technical indicators
+created in data_etl.feature_engineering, updated one close at a time
+for the COMP 642 final project, Spring 2024.
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import json
+import math
+import numpy as np
+
+
+class EwmMean:
+    '''
+    Exponentially weighted mean equal to series.ewm(span=span, adjust=False).mean(),
+    updated in constant time. Follows the same update steps as pandas so the values match exactly.
+    '''
+
+    def __init__(self, span):
+        self.span = span
+        self.alpha = 1. / (1. + (span - 1) / 2.)
+        self.weighted = None
+        self.old_wt = 1.
+
+    def update(self, value):
+        '''
+        Add the next value of the series.
+
+        Input:
+            - value: float value of the series
+
+        Return: float exponentially weighted mean after this value
+        '''
+        if self.weighted is None:
+            self.weighted = value
+            return self.weighted
+
+        is_observation = value == value
+        if self.weighted == self.weighted:
+            self.old_wt *= 1. - self.alpha
+            if is_observation:
+                # avoid numerical errors on constant series
+                if self.weighted != value:
+                    self.weighted = self.old_wt * self.weighted + self.alpha * value
+                    self.weighted /= (self.old_wt + self.alpha)
+                self.old_wt = 1.
+        elif is_observation:
+            self.weighted = value
+
+        return self.weighted
+
+    def to_dict(self):
+        return {'span': self.span, 'weighted': self.weighted, 'old_wt': self.old_wt}
+
+    @classmethod
+    def from_dict(cls, state):
+        ewm = cls(state['span'])
+        ewm.weighted = state['weighted']
+        ewm.old_wt = state['old_wt']
+        return ewm
+
+
+class RollingMean:
+    '''
+    Rolling mean equal to series.rolling(window=window).mean(), updated in constant time with
+    a ring buffer of the last window values. Uses the same Kahan summation as pandas so the values match exactly.
+    '''
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = []
+        self.position = 0
+        self.nobs = 0
+        self.neg_ct = 0
+        self.sum_x = 0.
+        self.compensation_add = 0.
+        self.compensation_remove = 0.
+        self.num_consecutive_same_value = 0
+        self.prev_value = None
+
+    def _add(self, value):
+        if value == value:
+            self.nobs += 1
+            y = value - self.compensation_add
+            t = self.sum_x + y
+            self.compensation_add = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1., value) < 0:
+                self.neg_ct += 1
+
+            # record the number of same values to remove floating point artifacts
+            if value == self.prev_value:
+                self.num_consecutive_same_value += 1
+            else:
+                self.num_consecutive_same_value = 1
+            self.prev_value = value
+
+    def _remove(self, value):
+        if value == value:
+            self.nobs -= 1
+            y = -value - self.compensation_remove
+            t = self.sum_x + y
+            self.compensation_remove = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1., value) < 0:
+                self.neg_ct -= 1
+
+    def update(self, value):
+        '''
+        Add the next value of the series, dropping the value that leaves the window.
+
+        Input:
+            - value: float value of the series
+
+        Return: float rolling mean, NaN until the window is full
+        '''
+        if self.prev_value is None or self.window == 1:
+            # first value (or a window of one) starts the sums from scratch like pandas does
+            self.nobs = self.neg_ct = 0
+            self.sum_x = self.compensation_add = self.compensation_remove = 0.
+            self.num_consecutive_same_value = 0
+            self.prev_value = value
+        elif len(self.buffer) == self.window:
+            self._remove(self.buffer[self.position])
+
+        if len(self.buffer) < self.window:
+            self.buffer.append(value)
+        else:
+            self.buffer[self.position] = value
+        self.position = (self.position + 1) % self.window
+        self._add(value)
+
+        if self.nobs < self.window:
+            return np.nan
+
+        result = self.sum_x / self.nobs
+        if self.num_consecutive_same_value >= self.nobs:
+            result = self.prev_value
+        elif self.neg_ct == 0 and result < 0:
+            result = 0.
+        elif self.neg_ct == self.nobs and result > 0:
+            result = 0.
+
+        return result
+
+    def to_dict(self):
+        return {key: value for key, value in vars(self).items()}
+
+    @classmethod
+    def from_dict(cls, state):
+        rolling = cls(state['window'])
+        vars(rolling).update(state)
+        rolling.buffer = list(state['buffer'])
+        return rolling
+
+
+class StreamingIndicators:
+    '''
+    Technical indicators of data_etl.feature_engineering (35-day EMA, 200-day SMA, MACD,
+    MACD signal and 14-day RSI) kept as running state, so a new close is added in
+    constant time and memory instead of recomputing the whole history.
+
+    The state can be seeded from history with from_history and saved with to_json so
+    a service can restart without replaying years of data.
+    '''
+
+    def __init__(self, ticker_symbol):
+        self.ticker_symbol = ticker_symbol
+        self.ema_35 = EwmMean(35)
+        self.ema_12 = EwmMean(12)
+        self.ema_26 = EwmMean(26)
+        self.macd_signal = EwmMean(9)
+        self.sma_200 = RollingMean(200)
+        self.rsi_gain = RollingMean(14)
+        self.rsi_loss = RollingMean(14)
+        self.prev_close = None
+
+    @classmethod
+    def from_history(cls, ticker_symbol, closes):
+        '''
+        Seed the indicator state from the historical closing prices.
+
+        Input:
+            - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+            - closes: sequence of historical closing prices, oldest first
+
+        Return: StreamingIndicators ready to be updated with the next close
+        '''
+        indicators = cls(ticker_symbol)
+        for close in np.asarray(closes, dtype=np.float64):
+            indicators.update(close)
+
+        return indicators
+
+    def update(self, close):
+        '''
+        Add the next closing price.
+
+        Input:
+            - close: float closing price of the new bar
+
+        Return: dictionary of indicator column name to value, NaN values filled with 0 like feature_engineering
+        '''
+        close = float(close)
+
+        # gains and losses as in the batch version, the first bar has no change and counts as 0
+        delta = close - self.prev_close if self.prev_close is not None else np.nan
+        gain = delta if delta > 0 else 0.
+        loss = -(delta if delta < 0 else 0.)
+        self.prev_close = close
+
+        macd = self.ema_12.update(close) - self.ema_26.update(close)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = np.float64(self.rsi_gain.update(gain)) / np.float64(self.rsi_loss.update(loss))
+            rsi = 100 - (100 / (1 + rs))
+
+        values = {
+            f'{self.ticker_symbol}_35_day_ema': self.ema_35.update(close),
+            f'{self.ticker_symbol}_200_day_sma': self.sma_200.update(close),
+            f'{self.ticker_symbol}_macd': macd,
+            f'{self.ticker_symbol}_macd_signal': self.macd_signal.update(macd),
+            f'{self.ticker_symbol}_rsi': float(rsi)
+        }
+
+        return {name: 0. if value != value else value for name, value in values.items()}
+
+    def to_json(self):
+        '''
+        Serialize the indicator state.
+
+        Return: JSON string holding the running accumulators and ring buffers
+        '''
+        return json.dumps({
+            'ticker_symbol': self.ticker_symbol,
+            'prev_close': self.prev_close,
+            'ewm': {name: getattr(self, name).to_dict() for name in ('ema_35', 'ema_12', 'ema_26', 'macd_signal')},
+            'rolling': {name: getattr(self, name).to_dict() for name in ('sma_200', 'rsi_gain', 'rsi_loss')}
+        })
+
+    @classmethod
+    def from_json(cls, payload):
+        '''
+        Restore the indicator state saved with to_json.
+
+        Input:
+            - payload: JSON string from to_json
+
+        Return: StreamingIndicators continuing from the saved state
+        '''
+        state = json.loads(payload)
+        indicators = cls(state['ticker_symbol'])
+        indicators.prev_close = state['prev_close']
+        for name, ewm_state in state['ewm'].items():
+            setattr(indicators, name, EwmMean.from_dict(ewm_state))
+        for name, rolling_state in state['rolling'].items():
+            setattr(indicators, name, RollingMean.from_dict(rolling_state))
+
+        return indicators
@@ -0,0 +1,61 @@
+"""
+This file contains the equivalence test of the array engine behind
+simulate_ret against the original row by row loop. The expected outputs
+are frozen in fixtures/simulate_ret_baseline.npz, produced by the loop
+taken verbatim from the baseline commit, see make_simulate_ret_fixture.py.
+
+Usage:
+    python -m pytest -q final_project/fp_3/test_simulate_ret.py
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import os
+import sys
+import pytest
+import pandas as pd
+import numpy as np
+
+pytest.importorskip('yfinance')
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from data_etl import simulate_ret
+from make_simulate_ret_fixture import FIXTURE, SEEDS, TICKER
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    with np.load(FIXTURE) as data:
+        return {name: data[name] for name in data.files}
+
+
+def history(baseline, seed):
+    '''
+    Rebuild the synthetic price history a fixture entry was produced from.
+
+    Input:
+        - baseline: dictionary of the fixture arrays
+        - seed: integer seed of the entry
+
+    Return: DataFrame with the close, volume and ret columns
+    '''
+    prefix = f'{seed}/input/'
+    columns = {name[len(prefix):]: values for name, values in baseline.items() if name.startswith(prefix)}
+
+    return pd.DataFrame({col: columns[col] for col in (f'{TICKER}_close', f'{TICKER}_volume', f'{TICKER}_ret')})
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_simulate_ret_matches_baseline(baseline, seed):
+    result = simulate_ret(history(baseline, seed), TICKER)
+    columns = baseline[f'{seed}/columns'].tolist()
+
+    assert list(result.columns) == columns
+    assert (result['decision'].to_numpy().astype(str) == baseline[f'{seed}/output/decision']).all()
+    for col in columns:
+        if col == 'decision':
+            continue
+        np.testing.assert_allclose(result[col].to_numpy(dtype=np.float64), baseline[f'{seed}/output/{col}'].astype(np.float64),
+                                   rtol=1e-12, atol=0, err_msg=col)
@@ -8,302 +8,181 @@ Instructor: Janell Straach
 """
 
 # import necessary packages
+import os
+import sys
+import queue
+import threading
 import pandas as pd
 import numpy as np
-import yfinance as yf
+from numpy.lib.stride_tricks import sliding_window_view
 import warnings
 warnings.filterwarnings('ignore')
 
-def yf_data_upload(start_date, end_date, ticker_symbol):
-    '''
-    Call the yfinance and upload the required data. For our data requirements
-    we will choose a start date of 2010-12-31 and an end date of 2024-02-29.
-
-    Input:
-        - start: string date in the format of yyyy-dd-mm for the start date of the data putll
-        - end: string date in the format of yyyy-dd-mm for the end date of the data pull
-        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
-    
-    return: DataFrame of historical stock price data
-    '''
-    # fetching daily adjusted close price, volume, and percent changes
-    equity_price = yf.download(ticker_symbol, start=start_date, end=end_date, group_by='ticker')[['Adj Close', 'Volume']]
-    equity_price[f'{ticker_symbol}_ret'] = equity_price['Adj Close'].pct_change()
-    equity_price.rename(columns={'Adj Close': f'{ticker_symbol}_close', 'Volume': f'{ticker_symbol}_volume'}, inplace=True)
-
-    tbf_price = pd.DataFrame(yf.download('TBF', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    tbf_price['tbf_ret'] = tbf_price['Adj Close'].pct_change()
-    tbf_price.rename(columns={'Adj Close': 'tbf_close', 'Volume': 'tbf_volume'}, inplace=True)
-
-    tip_price = pd.DataFrame(yf.download('TIP', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    tip_price['tip_ret'] = tip_price['Adj Close'].pct_change()
-    tip_price.rename(columns={'Adj Close': 'tip_close', 'Volume': 'tip_volume'}, inplace=True)
-
-    uup_price = pd.DataFrame(yf.download('UUP', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    uup_price['uup_ret'] = uup_price['Adj Close'].pct_change()
-    uup_price.rename(columns={'Adj Close': 'uup_close', 'Volume': 'uup_volume'}, inplace=True)
+# the data extraction, feature engineering and labels are shared with part 3
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fp_3'))
+from data_etl import yf_data_upload, feature_engineering, simulate_ret, build_future_labels, execute_etl
 
-    vixy_price = pd.DataFrame(yf.download('VIXY', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    vixy_price['vixy_ret'] = vixy_price['Adj Close'].pct_change()
-    vixy_price.rename(columns={'Adj Close': 'vixy_close', 'Volume': 'vixy_volume'}, inplace=True)
 
-    uso_price = pd.DataFrame(yf.download('USO', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    uso_price['uso_ret'] = uso_price['Adj Close'].pct_change()
-    uso_price.rename(columns={'Adj Close': 'uso_close', 'Volume': 'uso_volume'}, inplace=True)
-
-    gld_price = pd.DataFrame(yf.download('GLD', start=start_date, end=end_date)[['Adj Close', 'Volume']])
-    gld_price['gld_ret'] = gld_price['Adj Close'].pct_change()
-    gld_price.rename(columns={'Adj Close': 'gld_close', 'Volume': 'gld_volume'}, inplace=True)
-
-    # joining all data into a single dataframe according to the index (date)
-    df = pd.merge(equity_price, tbf_price, left_index=True, right_index=True)
-    df = pd.merge(df, tip_price, left_index=True, right_index=True)
-    df = pd.merge(df, uup_price, left_index=True, right_index=True)
-    df = pd.merge(df, vixy_price, left_index=True, right_index=True)
-    df = pd.merge(df, uso_price, left_index=True, right_index=True)
-    df = pd.merge(df, gld_price, left_index=True, right_index=True)
-    df.reset_index(inplace=True)
-
-    return df
-
-
-def feature_engineering(df, ticker_symbol):
+def rolling_window_scaling_and_save(series, window):
     '''
-    Creating required features that are fundamental in the investment process.
+    Function used to normalize data, using min-max scalling, based on 
+    user defined rolling window.
 
-    Inputs:
-        - DataFrame of historical stock price data.
-        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+    Input:
+        - series: dataframe defined as the dependent or independent variables.
+        - window: rolling window period
 
-    Return: DataFrame containing additional engineered features.
+    Return: series containing the scaled data, series containing min values, series containing max values
     '''
-    # feature engineering {ticker_symbol} technical indicator data
-    # 35-day EMA
-    df[f'{ticker_symbol}_35_day_ema'] = df[f'{ticker_symbol}_close'].ewm(span=35, adjust=False).mean()
-
-    # Calculate 200-day SMA
-    df[f'{ticker_symbol}_200_day_sma'] = df[f'{ticker_symbol}_close'].rolling(window=200).mean()
-
-    # Calculate MACD and MACD signal
-    df[f'{ticker_symbol}_macd'] = df[f'{ticker_symbol}_close'].ewm(span=12, adjust=False).mean() - df[f'{ticker_symbol}_close'].ewm(span=26, adjust=False).mean()
-    df[f'{ticker_symbol}_macd_signal'] = df[f'{ticker_symbol}_macd'].ewm(span=9, adjust=False).mean()
-
-    # Calculate RSI
-    delta = df[f'{ticker_symbol}_close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    rs = gain / loss
-    df[f'{ticker_symbol}_rsi'] = 100 - (100 / (1 + rs))
-    df.fillna(0, inplace=True)
+    min_series = series.rolling(window=window, min_periods=window).min()
+    max_series = series.rolling(window=window, min_periods=window).max()
+    scaled_series = (series - min_series) / (max_series - min_series)
     
-    return df
+    return scaled_series, min_series, max_series
 
 
-def simulate_ret(df, ticker_symbol):
+def rolling_min_max(values, window, out_min=None, out_max=None, chunk_rows=4096):
     '''
-    Simulate the perfect investment strategy with already knowing future equity prices.
+    Rolling min and max of every column of an array in linear time (van Herk/Gil-Werman). The rows are
+    cut into blocks of window rows, and every window is covered by the running max from its start to
+    the end of its block and the running max from the start of the next block to its end. The blocks
+    are worked through in chunks so the extra memory does not grow with the number of rows, and every
+    chunk is laid out by row offset within the blocks so each step of the running max is one contiguous
+    operation over all blocks and columns.
+    Equal to series.rolling(window=window, min_periods=window).min()/.max() for every column, NaN included.
 
     Input:
-        - df: DataFrame containing all stock price data.
-        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
+        - values: float array of shape [rows] or [rows, columns]
+        - window: rolling window period
+        - out_min: optional preallocated array the rolling min is written to
+        - out_max: optional preallocated array the rolling max is written to
+        - chunk_rows: approximate number of rows worked on at once
 
-    Return: df DataFrame with the simulated returns and dependent variables.
+    Return: arrays of the rolling min and max, NaN for the first window - 1 rows
     '''
+    values = np.asarray(values, dtype=np.float64)
+    out_min = np.empty(values.shape) if out_min is None else out_min
+    out_max = np.empty(values.shape) if out_max is None else out_max
+
+    n = len(values)
+    flat = values.reshape(n, -1)
+    out_min[:window - 1] = np.nan
+    out_max[:window - 1] = np.nan
+    if n < window:
+        return out_min, out_max
+
+    full = (n // window) * window
+    step = max(1, chunk_rows // window) * window
+    shape = (window, step // window, flat.shape[1])
+    blocks, prefix, suffix = np.empty(shape), np.empty(shape), np.empty(shape)
+    outputs = ((out_max.reshape(n, -1), np.maximum), (out_min.reshape(n, -1), np.minimum))
+    previous = {}
+
+    for start in range(0, full, step):
+        stop = min(start + step, full)
+        count = (stop - start) // window
+        # the rows of the chunk as [offset in block, block, column]
+        chunk = blocks[:, :count]
+        np.copyto(chunk, flat[start:stop].reshape(count, window, -1).transpose(1, 0, 2))
+
+        for out, func in outputs:
+            # running max from the start of every block and to the end of it
+            chunk_prefix, chunk_suffix = prefix[:, :count], suffix[:, :count]
+            chunk_prefix[0] = chunk[0]
+            for i in range(1, window):
+                func(chunk_prefix[i - 1], chunk[i], out=chunk_prefix[i])
+            chunk_suffix[-1] = chunk[-1]
+            for i in range(window - 2, -1, -1):
+                func(chunk_suffix[i + 1], chunk[i], out=chunk_suffix[i])
+
+            # the window ending at offset i of a block starts at offset i + 1 of the block before it,
+            # the results overwrite the running max from the start of the blocks
+            result = chunk_prefix
+            func(chunk_suffix[1:, :-1], chunk_prefix[:-1, 1:], out=result[:-1, 1:])
+            func(chunk_suffix[0], chunk_prefix[-1], out=result[-1])
+            # windows ending in the first block of the chunk start in the last block of the previous chunk
+            if func in previous:
+                func(previous[func][1:], chunk_prefix[:-1, 0], out=result[:-1, 0])
+            else:
+                result[:-1, 0] = np.nan
+            previous[func] = chunk_suffix[:, -1].copy()
+
+            out[start:stop].reshape(count, window, -1)[:] = result.transpose(1, 0, 2)
+
+    # windows ending in the last partial block
+    if full < n:
+        for out, func in outputs:
+            func(previous[func][1:n - full + 1], func.accumulate(flat[full:], axis=0), out=out[full:])
+
+    return out_min, out_max
+
+
+def _drop_nan_rows(values, index, columns):
+    '''
+    DataFrame of the rows without NaN, like DataFrame.dropna. When only the first rows hold NaN,
+    as after the rolling window, the remaining rows are kept without a copy.
+    '''
+    keep = ~np.isnan(values).any(axis=1)
+    first = int(keep.argmax())
 
-    # buy, sell, hold decision variable
-    df['decision'] = ''
-
-    # simulating cash position set to the starting price of {ticker_symbol}
-    df['cash'] = df[f'{ticker_symbol}_close'][0]
-
-    # daily return on cash, significant for shorts and if we need to add cumulative return at any point
-    df['cash_ret'] = df[f'{ticker_symbol}_ret'][0]
-
-    # the initial number of days that we are set to hold a security, could be used as categorical at any point
-    df['initial_hold_days'] = 1
-
-    # countdown check to be sure code is executing properly
-    df['hold_countdown'] = 1
-
-    # variable we will use as a countdown indicator for updating the iterative algorithm
-    days_to_hold = 0
-
-    # indicating how we will change the return value, either maintaining positive for buy or inverse for shorts
-    hold_type = 'long'
-
-    for idx in range(len(df)):
-        if idx == 0:
-            # decision day 0 as long as entry into the market
-            df['decision'][idx] = 'long'
-
-        elif (idx < len(df)-20) & (idx != 0):
-
-            # reaching the end of the days_to_hold, trigger new hold_dict with future returns
-            if days_to_hold <= 1:
-            
-                # determine how many days to hold for greatest return
-                hold_dict = {
-                    1: (df[f'{ticker_symbol}_close'][idx+1]/df[f'{ticker_symbol}_close'][idx])-1,
-                    3: (df[f'{ticker_symbol}_close'][idx+3]/df[f'{ticker_symbol}_close'][idx])-1,
-                    5: (df[f'{ticker_symbol}_close'][idx+5]/df[f'{ticker_symbol}_close'][idx])-1,
-                    10: (df[f'{ticker_symbol}_close'][idx+10]/df[f'{ticker_symbol}_close'][idx])-1,
-                    20: (df[f'{ticker_symbol}_close'][idx+20]/df[f'{ticker_symbol}_close'][idx])-1
-                }
-
-                # if all future values are negative, short the stock
-                if all(value < 0 for value in hold_dict.values()):
-
-                    # when the initial position is a short, finish the current day as short
-                    if hold_type == 'short':
-                        
-                        df['decision'][idx] = 'short'
-                        days_to_hold = min(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'short'
-
-                    # when the initial position is a long, finish the current day as long
-                    elif hold_type == 'long':
-
-                        df['decision'][idx] = 'short'
-                        days_to_hold = min(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'short'
-
-                else:
-
-                    # go long otherwise
-                    if hold_type == 'short':
-                        # when the initial position is a short, finish the current day as short
-                        df['decision'][idx] = 'long'
-                        days_to_hold = max(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'long'
-                    
-                    elif hold_type == 'long':
-                        # when the initial position is a long, finish the current day as long
-                        df['decision'][idx] = 'long'
-                        days_to_hold = max(hold_dict, key=hold_dict.get)
-                        df['initial_hold_days'][idx] = days_to_hold
-                        df['hold_countdown'][idx] = days_to_hold
-                        df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]))
-                        df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                        hold_type = 'long'
-
-            elif days_to_hold > 1:
-
-                # when a days_to_hold is decided - continue position until end of the hold days
-                if hold_type == 'long':
-                    df['decision'][idx] = 'hold'
-                    df['cash'][idx] = df['cash'][idx-1]*(1+df[f'{ticker_symbol}_ret'][idx])
-                    df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                    days_to_hold -= 1
-                    df['hold_countdown'][idx] = days_to_hold
-                    df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-                    
-                elif hold_type == 'short':
-                    df['decision'][idx] = 'hold'
-                    df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1)) 
-                    df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                    days_to_hold -= 1
-                    df['hold_countdown'][idx] = days_to_hold
-                    df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-
-        else:
-            # when we get to the end of our dataframe hold our current position (long/short)
-            if hold_type == 'long':
-                df['decision'][idx] = 'hold'
-                df['cash'][idx] = df['cash'][idx-1]*(1+df[f'{ticker_symbol}_ret'][idx])
-                df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                df['hold_countdown'][idx] = 0
-                df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-                
-            elif hold_type == 'short':
-                df['decision'][idx] = 'hold'
-                df['cash'][idx] = df['cash'][idx-1]*(1+(df[f'{ticker_symbol}_ret'][idx]*-1))
-                df['cash_ret'][idx] = (df['cash'][idx]/df['cash'][idx-1])-1
-                df['hold_countdown'][idx] = 0
-                df['initial_hold_days'][idx] = df['initial_hold_days'][idx-1]
-    
-    # create future day close features
-    df[f'{ticker_symbol}_1_day_close'] = 0
-    df[f'{ticker_symbol}_3_day_close'] = 0
-    df[f'{ticker_symbol}_5_day_close'] = 0
-    df[f'{ticker_symbol}_10_day_close'] = 0
-    df[f'{ticker_symbol}_20_day_close'] = 0
-
-    # document future price values
-    for idx in range(len(df)):
-        if idx <= len(df)-21:
-
-            df[f'{ticker_symbol}_1_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+1]
-            df[f'{ticker_symbol}_3_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+3]
-            df[f'{ticker_symbol}_5_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+5]
-            df[f'{ticker_symbol}_10_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+10]
-            df[f'{ticker_symbol}_20_day_close'][idx] = df[f'{ticker_symbol}_close'][idx+20]
-        
-        else:
-            df[f'{ticker_symbol}_1_day_close'][idx] = 0
-            df[f'{ticker_symbol}_3_day_close'][idx] = 0
-            df[f'{ticker_symbol}_5_day_close'][idx] = 0
-            df[f'{ticker_symbol}_10_day_close'][idx] = 0
-            df[f'{ticker_symbol}_20_day_close'][idx] = 0
-
-    # will only return data that reports the beginning of the 200 day moving average and the last 20 days
-    df = df.iloc[199:-20]
-    df = df.reset_index(drop=True)
+    if keep.any() and keep[first:].all():
+        return pd.DataFrame(values[first:], index=index[first:], columns=columns)
 
-    return df
+    return pd.DataFrame(values[keep], index=index[keep], columns=columns)
 
 
-def execute_etl(start_date, end_date, ticker_symbol):
+def _rolling_scale(values, window, chunk_rows=4096):
     '''
-    Execute the data extraction and features engineering functions
+    Rolling window min-max scaling of every column of an array at once.
 
     Input:
-        - start: string date in the format of yyyy-dd-mm for the start date of the data putll
-        - end: string date in the format of yyyy-dd-mm for the end date of the data pull
-        - ticker_symbol: string value in all caps that will be used for the ticker in our analysis
-    
-    Return: DataFrame of historical stock price data 
+        - values: float array of shape [rows, features]
+        - window: integer rolling window period
+        - chunk_rows: number of rows normalized at once
+
+    Return: array of the normalized values and array of the min/max values, where the min and max
+            columns alternate like {feature}_min, {feature}_max for every feature
     '''
-    df = yf_data_upload(start_date, end_date, ticker_symbol)
-    df = feature_engineering(df, ticker_symbol)
-    df = simulate_ret(df, ticker_symbol)
+    min_max_values = np.empty((len(values), 2 * values.shape[1]))
+    min_values, max_values = min_max_values[:, 0::2], min_max_values[:, 1::2]
+    rolling_min_max(values, window, out_min=min_values, out_max=max_values, chunk_rows=chunk_rows)
 
-    return df
+    normalized = np.empty(values.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(values), chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            np.subtract(values[rows], min_values[rows], out=normalized[rows])
+            normalized[rows] /= max_values[rows] - min_values[rows]
 
+    return normalized, min_max_values
 
-def rolling_window_scaling_and_save(series, window):
+
+def _scale_frame(window, df, chunk_rows=4096):
     '''
-    Function used to normalize data, using min-max scalling, based on 
-    user defined rolling window.
+    Rolling window min-max scaling of every column of a dataframe at once.
 
     Input:
-        - series: dataframe defined as the dependent or independent variables.
-        - window: rolling window period
+        - window: integer rolling window period
+        - df: dataframe of the variables
+        - chunk_rows: number of rows normalized at once
 
-    Return: series containing the scaled data, series containing min values, series containing max values
+    Return: dataframe of the normalized values and dataframe of the min/max values, with the rows holding NaN dropped
     '''
-    min_series = series.rolling(window=window, min_periods=window).min()
-    max_series = series.rolling(window=window, min_periods=window).max()
-    scaled_series = (series - min_series) / (max_series - min_series)
-    
-    return scaled_series, min_series, max_series
+    features = df.columns.values
+    normalized, min_max_values = _rolling_scale(df.to_numpy(dtype=np.float64), window, chunk_rows)
+
+    min_max_columns = [f'{feature}_{stat}' for feature in features for stat in ('min', 'max')]
+    normalized = _drop_nan_rows(normalized, df.index, [f'{feature}_scaled' for feature in features])
+    min_max_values = _drop_nan_rows(min_max_values, df.index, min_max_columns)
+
+    return normalized, min_max_values
 
 
 def apply_feature_scaling(window, x_rnn_train, y_rnn_train=0, training_set=False):
     '''
-    Function used to apply the rolling_window_scaling_and_save function more intuitively
-    to our dataframes.
+    Function used to apply the rolling window min-max scaling more intuitively to our dataframes.
+    Every column is scaled in one pass with rolling_min_max, giving the same values as
+    rolling_window_scaling_and_save on each column.
 
     Input:
         - window: integer rolling window period
@@ -313,42 +192,16 @@ def apply_feature_scaling(window, x_rnn_train, y_rnn_train=0, training_set=False
 
     Return: four dataframes containing normalized features and the min-max values for each rolling period row
     '''
-    if training_set == True:
-        # new normalized placeholder and min/max value placeholder to recall from the normalization
-        x_rnn_train_normalized = pd.DataFrame(index=x_rnn_train.index)
-        x_rnn_train_min_max_values = pd.DataFrame(index=x_rnn_train.index)
+    # new normalized features and min/max values to recall from the normalization
+    x_rnn_train_normalized, x_rnn_train_min_max_values = _scale_frame(window, x_rnn_train)
 
+    if training_set == True:
         # y min_max values will be used to convert the normalized y back to the actual values
-        y_rnn_train_normalized = pd.DataFrame(index=y_rnn_train.index)
-        y_rnn_train_min_max_values = pd.DataFrame(index=y_rnn_train.index)
-
-        # apply rolling window scaling to features and save min/max
-        for feature in x_rnn_train.columns.values:
-            x_rnn_train_normalized[f'{feature}_scaled'], x_rnn_train_min_max_values[f'{feature}_min'], x_rnn_train_min_max_values[f'{feature}_max'] = rolling_window_scaling_and_save(x_rnn_train[feature], window)
-
-        for feature in y_rnn_train.columns.values:
-            y_rnn_train_normalized[f'{feature}_scaled'], y_rnn_train_min_max_values[f'{feature}_min'], y_rnn_train_min_max_values[f'{feature}_max'] = rolling_window_scaling_and_save(y_rnn_train[feature], window)
-
-        x_rnn_train_normalized.dropna(inplace=True)
-        y_rnn_train_normalized.dropna(inplace=True)
-        x_rnn_train_min_max_values.dropna(inplace=True)
-        y_rnn_train_min_max_values.dropna(inplace=True)
+        y_rnn_train_normalized, y_rnn_train_min_max_values = _scale_frame(window, y_rnn_train)
 
         return x_rnn_train_normalized, x_rnn_train_min_max_values, y_rnn_train_normalized, y_rnn_train_min_max_values
-    
-    else:
-        # new normalized placeholder and min/max value placeholder to recall from the normalization
-        x_rnn_train_normalized = pd.DataFrame(index=x_rnn_train.index)
-        x_rnn_train_min_max_values = pd.DataFrame(index=x_rnn_train.index)
-
-        # apply rolling window scaling to features and save min/max
-        for feature in x_rnn_train.columns.values:
-            x_rnn_train_normalized[f'{feature}_scaled'], x_rnn_train_min_max_values[f'{feature}_min'], x_rnn_train_min_max_values[f'{feature}_max'] = rolling_window_scaling_and_save(x_rnn_train[feature], window)
 
-        x_rnn_train_normalized.dropna(inplace=True)
-        x_rnn_train_min_max_values.dropna(inplace=True)
-
-        return x_rnn_train_normalized, x_rnn_train_min_max_values
+    return x_rnn_train_normalized, x_rnn_train_min_max_values
 
 
 def reverse_rolling_window_scaling(scaled_series, min_series, max_series):
@@ -368,7 +221,237 @@ def reverse_rolling_window_scaling(scaled_series, min_series, max_series):
     return original_series
 
 
-def re_shape_df(sequence_length, x_rnn_train_normalized, y_rnn_train_normalized=0, train_set=False):
+def index_to_array(index):
+    '''
+    Store an index as an array without Python objects, so it can be saved with np.save and memory-mapped.
+
+    Input:
+        - index: pandas Index or None
+
+    Return: array and string kind ('none', 'datetime', 'string' or 'values') for index_from_array
+    '''
+    if index is None:
+        return np.empty(0), 'none'
+
+    if isinstance(index, pd.DatetimeIndex):
+        # dates as datetime64, a timezone is dropped keeping the local times
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        return index.to_numpy(dtype='datetime64[ns]'), 'datetime'
+
+    values = index.to_numpy()
+    if values.dtype == object:
+        return values.astype(str), 'string'
+
+    return values, 'values'
+
+
+def index_from_array(values, kind):
+    '''
+    Rebuild an index stored with index_to_array.
+
+    Input:
+        - values: array from index_to_array
+        - kind: string kind from index_to_array
+
+    Return: pandas Index or None
+    '''
+    if kind == 'none':
+        return None
+    if kind == 'datetime':
+        return pd.DatetimeIndex(values)
+    if kind == 'string':
+        return pd.Index(values.astype(object))
+
+    return pd.Index(values)
+
+
+class RollingScaler:
+    '''
+    Rolling window min-max scaler that remembers what it needs to continue and to reverse the scaling.
+    It keeps the last window - 1 rows it has seen, so new rows are scaled exactly as if they had been
+    scaled together with the history, and the min/max values of the rows it scaled last, lined up with
+    the rows it returned. Saved to disk as a small .npz file.
+
+    Usage:
+        scaler = RollingScaler(20)
+        y_train_normalized = scaler.fit_transform(y_train)
+        y_test_normalized = scaler.transform(y_test)
+        x_test_reshape, y_test_reshape = re_shape_df(20, x_test_normalized, y_test_normalized, train_set=True)
+        y_pred = scaler.inverse_transform(model.predict(x_test_reshape), sequence_length=20)
+    '''
+
+    def __init__(self, window):
+        self.window = window
+        self.columns = None
+        self.state = None
+        self.min_values = None
+        self.max_values = None
+        self.index = None
+
+    def fit_transform(self, df):
+        '''
+        Scale a history from scratch, like apply_feature_scaling.
+
+        Input:
+            - df: dataframe of the variables
+
+        Return: dataframe of the normalized values, rows holding NaN dropped
+        '''
+        self.columns = [str(col) for col in df.columns]
+        self.state = np.empty((0, len(self.columns)))
+
+        return self.transform(df)
+
+    def transform(self, df):
+        '''
+        Scale the rows following the rows seen so far, the first rows use the remembered rows as their window.
+
+        Input:
+            - df: dataframe of the new rows, with the columns the scaler was fit on
+
+        Return: dataframe of the normalized values, rows holding NaN dropped
+        '''
+        if self.columns is None:
+            raise ValueError('the scaler has to be fit first')
+        if [str(col) for col in df.columns] != self.columns:
+            raise ValueError(f'expected the columns {self.columns}')
+
+        values = np.concatenate([self.state, df.to_numpy(dtype=np.float64)])
+        normalized, min_max_values = _rolling_scale(values, self.window)
+        normalized, min_max_values = normalized[len(self.state):], min_max_values[len(self.state):]
+        self.state = values[-(self.window - 1):].copy() if self.window > 1 else values[:0].copy()
+
+        # the min/max values are kept only for the rows that are returned
+        keep = ~np.isnan(normalized).any(axis=1)
+        self.min_values = min_max_values[keep, 0::2].copy()
+        self.max_values = min_max_values[keep, 1::2].copy()
+        self.index = df.index[keep]
+
+        return pd.DataFrame(normalized[keep], index=self.index, columns=[f'{col}_scaled' for col in self.columns])
+
+    def inverse_transform(self, scaled, sequence_length=None):
+        '''
+        Reverse the scaling of values lined up with the rows returned by the last transform.
+
+        Input:
+            - scaled: array of scaled values (e.g. predictions) of shape [rows, features]
+            - sequence_length: integer sequence length when the rows come from re_shape_df or WindowBatches,
+                               then row i belongs to the transformed row i + sequence_length - 1
+
+        Return: dataframe of the values in the original scale, with the original columns and the matching index
+        '''
+        scaled = np.asarray(scaled, dtype=np.float64)
+        start = 0 if sequence_length is None else sequence_length - 1
+        rows = slice(start, start + len(scaled))
+
+        if start + len(scaled) > len(self.min_values):
+            raise ValueError(f'{len(scaled)} rows starting at row {start} do not fit the {len(self.min_values)} transformed rows')
+
+        original = reverse_rolling_window_scaling(scaled, self.min_values[rows], self.max_values[rows])
+        index = self.index[rows] if self.index is not None else None
+
+        return pd.DataFrame(original, index=index, columns=self.columns)
+
+    def save(self, path):
+        '''
+        Save the scaler to a .npz file, the dates of the transformed rows included.
+
+        Input:
+            - path: file path
+        '''
+        index, index_kind = index_to_array(self.index)
+        np.savez(
+            path, window=self.window, columns=np.array(self.columns), state=self.state,
+            min_values=self.min_values, max_values=self.max_values, index=index, index_kind=index_kind
+        )
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load a scaler saved with save.
+
+        Input:
+            - path: file path
+
+        Return: RollingScaler continuing from the saved state
+        '''
+        with np.load(path) as data:
+            scaler = cls(int(data['window']))
+            scaler.columns = data['columns'].tolist()
+            scaler.state = data['state']
+            scaler.min_values = data['min_values']
+            scaler.max_values = data['max_values']
+            # files saved before the index was kept have none
+            if 'index' in data:
+                scaler.index = index_from_array(data['index'], str(data['index_kind']))
+
+        return scaler
+
+
+# arrays of a RollingScaler stored by save_scaler, as <name>.<attribute>.npy
+SCALER_ARRAYS = ('state', 'min_values', 'max_values', 'index')
+
+
+def save_scaler(folder, name, scaler):
+    '''
+    Save the arrays of a fitted RollingScaler as <name>.<attribute>.npy files, so they can be memory-mapped
+    by load_scaler. Unlike RollingScaler.save, several scalers can share a folder with other arrays.
+
+    Input:
+        - folder: folder the files are written to
+        - name: string name of the scaler, the prefix of its files
+        - scaler: fitted RollingScaler
+
+    Return: dictionary of the scaler metadata needed by load_scaler, it can be stored as JSON
+    '''
+    index, index_kind = index_to_array(scaler.index)
+    arrays = {
+        'state': np.asarray(scaler.state, dtype=np.float64),
+        'min_values': np.asarray(scaler.min_values, dtype=np.float64),
+        'max_values': np.asarray(scaler.max_values, dtype=np.float64),
+        'index': index
+    }
+    for attribute in SCALER_ARRAYS:
+        np.save(os.path.join(folder, f'{name}.{attribute}.npy'), np.ascontiguousarray(arrays[attribute]))
+
+    return {'window': scaler.window, 'columns': scaler.columns, 'index_kind': index_kind}
+
+
+def load_scaler(folder, name, scaler_meta):
+    '''
+    Attach a RollingScaler saved with save_scaler, its arrays are read-only memory maps.
+
+    Input:
+        - folder: folder the files were written to
+        - name: string name of the scaler
+        - scaler_meta: dictionary returned by save_scaler
+
+    Return: RollingScaler
+    '''
+    scaler = RollingScaler(scaler_meta['window'])
+    scaler.columns = scaler_meta['columns']
+    for attribute in SCALER_ARRAYS:
+        setattr(scaler, attribute, np.load(os.path.join(folder, f'{name}.{attribute}.npy'), mmap_mode='r'))
+    scaler.index = index_from_array(scaler.index, scaler_meta['index_kind'])
+
+    return scaler
+
+
+def sequence_windows(values, sequence_length):
+    '''
+    Every run of sequence_length consecutive rows as a read-only view, nothing is copied.
+
+    Input:
+        - values: array of shape [rows, features]
+        - sequence_length: integer value that represents the number of days which the RNN model will consider
+
+    Return: array view of shape [rows - sequence_length + 1, sequence_length, features], window i holds rows i to i + sequence_length - 1
+    '''
+    return sliding_window_view(values, sequence_length, axis=0).transpose(0, 2, 1)
+
+
+def re_shape_df(sequence_length, x_rnn_train_normalized, y_rnn_train_normalized=0, train_set=False, view=False, dtype=None):
     '''
     Reshapping the independent and dependent variable data to run in our RNN. If train_set is equal to False then
     that assumes that this re-shapping will be applied to make a prediction.
@@ -378,35 +461,146 @@ def re_shape_df(sequence_length, x_rnn_train_normalized, y_rnn_train_normalized=
         - x_rnn_train_normalized: dataframe containing our independent variables
         - y_rnn_train_normalized: dataframe containing our dependent varialbes
         - train_set: boolean indicating if re-shapping will be applied to a test set or to make predictions
+        - view: boolean if True then X (and y) are read-only views of the input data instead of copies,
+                X uses sequence_length times less memory than the copy
+        - dtype: float dtype of the copies when view is False (np.float64 when None), e.g. np.float32 for frameworks
+                 that need contiguous input. Views keep the dtype of the input, a different dtype raises a ValueError
 
     Return: reshapped X and y data
     '''
 
     # convert dataframe to np array if not already (for safe indexing)
-    x_rnn_train_normalized = x_rnn_train_normalized.to_numpy() if hasattr(x_rnn_train_normalized, 'to_numpy') else x_rnn_train_normalized
-    y_rnn_train_normalized = y_rnn_train_normalized.to_numpy() if hasattr(y_rnn_train_normalized, 'to_numpy') else y_rnn_train_normalized
+    x_rnn_train_normalized = x_rnn_train_normalized.to_numpy() if hasattr(x_rnn_train_normalized, 'to_numpy') else np.asarray(x_rnn_train_normalized)
+
+    if view and dtype is not None and np.dtype(dtype) != x_rnn_train_normalized.dtype:
+        raise ValueError(f'a view keeps the input dtype {x_rnn_train_normalized.dtype}, use view=False to get {np.dtype(dtype)}')
+    if dtype is None:
+        dtype = np.float64
+
+    # X[i] holds rows i to i + sequence_length - 1, the last full window is left out as before
+    n_samples = len(x_rnn_train_normalized) - sequence_length
+    X = sequence_windows(x_rnn_train_normalized, sequence_length)[:n_samples]
+    if not view:
+        X = np.ascontiguousarray(X, dtype=dtype)
 
     if train_set == True:
-        # initialize the resulting X and y arrays for training the RNN
-        X = np.zeros((len(x_rnn_train_normalized) - sequence_length, sequence_length, x_rnn_train_normalized.shape[1]))
-        y = np.zeros((len(y_rnn_train_normalized) - sequence_length, y_rnn_train_normalized.shape[1]))
+        y_rnn_train_normalized = y_rnn_train_normalized.to_numpy() if hasattr(y_rnn_train_normalized, 'to_numpy') else np.asarray(y_rnn_train_normalized)
 
-        for i in range(len(x_rnn_train_normalized) - sequence_length):
-            X[i] = x_rnn_train_normalized[i:i+sequence_length]  # Shape [sequence_length, 26]
-            y[i] = y_rnn_train_normalized[i + sequence_length - 1]  # Shape [5]
+        # y[i] is the target of the last row of X[i]
+        y = y_rnn_train_normalized[sequence_length - 1:sequence_length - 1 + n_samples]
+        if view:
+            y = y.view()
+            y.flags.writeable = False
+        else:
+            y = np.array(y, dtype=dtype)
 
         print(f'shape of x: {X.shape}')
         print(f'shape of y: {y.shape}')
 
         return X, y
 
-    else:
-        # initialize the resulting X array for testing the RNN
-        X = np.zeros((len(x_rnn_train_normalized) - sequence_length, sequence_length, len(x_rnn_train_normalized.columns)))
+    print(f'shape of x train: {X.shape}')
+
+    return X
 
-        for i in range(len(x_rnn_train_normalized) - sequence_length):
-            X[i] = x_rnn_train_normalized[i:i+sequence_length]  # Shape [sequence_length, 26]
 
-        print(f'shape of x train: {X.shape}')
+class WindowBatches:
+    '''
+    Mini-batches of the (X, y) samples of re_shape_df, cut from the 2D arrays only when a batch is
+    needed so the 3D array of every window is never built. The next batches are prepared in a
+    background thread while the current one trains, and a seed makes the shuffled order repeatable.
+
+    Usage with keras:
+        batches = WindowBatches(x_train_normalized, y_train_normalized, 20, batch_size=28, seed=42)
+        model.fit(batches.repeat(), steps_per_epoch=len(batches), epochs=50)
+    '''
 
-        return X
+    def __init__(self, x_rnn_train_normalized, y_rnn_train_normalized, sequence_length, batch_size=32,
+                 shuffle=True, seed=None, dtype=np.float32, prefetch=2):
+        '''
+        Input:
+            - x_rnn_train_normalized: dataframe or 2D array containing our independent variables
+            - y_rnn_train_normalized: dataframe or 2D array containing our dependent varialbes
+            - sequence_length: integer value that represents the number of days which the RNN model will consider
+            - batch_size: integer number of samples per batch
+            - shuffle: boolean if True then every epoch visits the samples in a new random order
+            - seed: integer seed of the shuffling, None for fresh randomness
+            - dtype: float dtype of the batches
+            - prefetch: integer number of batches prepared ahead
+        '''
+        x = x_rnn_train_normalized.to_numpy() if hasattr(x_rnn_train_normalized, 'to_numpy') else np.asarray(x_rnn_train_normalized)
+        y = y_rnn_train_normalized.to_numpy() if hasattr(y_rnn_train_normalized, 'to_numpy') else np.asarray(y_rnn_train_normalized)
+
+        # same samples as re_shape_df, sample i is rows i to i + sequence_length - 1 and the target of its last row
+        self.n_samples = len(x) - sequence_length
+        self.windows = sequence_windows(x, sequence_length)
+        self.targets = y[sequence_length - 1:]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.dtype = dtype
+        self.prefetch = prefetch
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return -(-self.n_samples // self.batch_size)
+
+    def batch(self, samples):
+        '''
+        Build the batch of the given samples.
+
+        Input:
+            - samples: array of integer sample positions
+
+        Return: X of shape [batch, sequence_length, features] and y of shape [batch, targets]
+        '''
+        return self.windows[samples].astype(self.dtype, copy=False), self.targets[samples].astype(self.dtype, copy=False)
+
+    def _batches(self):
+        # the order of one epoch, drawn when the epoch starts
+        order = self.rng.permutation(self.n_samples) if self.shuffle else np.arange(self.n_samples)
+        for start in range(0, self.n_samples, self.batch_size):
+            yield self.batch(order[start:start + self.batch_size])
+
+    def __iter__(self):
+        '''
+        Iterate over the batches of one epoch, built ahead in a background thread.
+        '''
+        ready = queue.Queue(maxsize=max(self.prefetch, 1))
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for item in self._batches():
+                    # give up when the consumer stopped early
+                    while not stop.is_set():
+                        try:
+                            ready.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+                ready.put(done)
+            except BaseException as error:
+                ready.put(error)
+
+        worker = threading.Thread(target=produce, daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def repeat(self):
+        '''
+        Iterate over the batches of epoch after epoch without end, for keras steps_per_epoch training.
+        '''
+        while True:
+            yield from self
@@ -0,0 +1,266 @@
+"""
+This file contains the on-disk cache of the prepared RNN tensors. An
+entry is addressed by a hash of the preparation inputs (ticker, dates,
+window, sequence_length, ...) and a fingerprint of the source data, and
+holds the windowed X/y arrays and the fitted scalers as .npy files, so a
+repeat run memory-maps them instead of running the preparation chain
+again. The least recently used entries are evicted to stay under a
+disk budget.
+
+Usage:
+    cache = PrepCache('prep_cache', max_bytes=2 * 1024 ** 3)
+
+    def build():
+        df = execute_etl('2010-12-31', '2024-02-29', 'TQQQ', fetcher=cached_fetcher('price_cache'))
+        ...
+        return {'x_train': x_rnn_train_reshape_20, 'y_train': y_rnn_train_reshape_20, 'y_scaler': scaler}
+
+    tensors = cache.get_or_build(build, ticker='TQQQ', start='2010-12-31', end='2024-02-29', window=20,
+                                 sequence_length=20, source=fingerprint(Path('price_cache')))
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+import numpy as np
+from data_etl_rnn_prep import RollingScaler, save_scaler, load_scaler
+
+# errors of an entry that cannot be read, e.g. a file left by an older version or cut short on disk
+UNREADABLE = (OSError, ValueError, KeyError, TypeError, json.JSONDecodeError)
+
+
+def fingerprint(*sources):
+    '''
+    Fingerprint of the source data an entry is prepared from.
+
+    Input:
+        - sources: DataFrames or Series (hashed with their index and columns), arrays (hashed with their
+                   shape and dtype), os.PathLike paths to files or folders (their names, sizes and modification
+                   times, the files are not read) or any other value (its repr)
+
+    Return: hex string
+    '''
+    digest = hashlib.sha256()
+
+    for source in sources:
+        if isinstance(source, (pd.DataFrame, pd.Series)):
+            digest.update(repr(list(source.columns) if isinstance(source, pd.DataFrame) else source.name).encode())
+            digest.update(pd.util.hash_pandas_object(source, index=True).to_numpy().tobytes())
+
+        elif isinstance(source, np.ndarray):
+            digest.update(f'{source.shape}{source.dtype}'.encode())
+            digest.update(np.ascontiguousarray(source).tobytes())
+
+        elif isinstance(source, os.PathLike):
+            path = os.fspath(source)
+            if os.path.isdir(path):
+                files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+            else:
+                files = [path]
+            for file in files:
+                stat = os.stat(file)
+                digest.update(f'{os.path.relpath(file, path)}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+
+        else:
+            digest.update(repr(source).encode())
+
+    return digest.hexdigest()
+
+
+def _plain_array(name, value):
+    '''
+    Array of a value to save, Python objects cannot be memory-mapped so they are rejected before anything is stored.
+
+    Return: C-contiguous array
+    '''
+    value = np.ascontiguousarray(value)
+    if value.dtype.hasobject:
+        raise TypeError(f'{name} holds Python objects and cannot be memory-mapped, convert it to a numeric array')
+
+    return value
+
+
+class PrepCache:
+    '''
+    Content-addressed cache of prepared tensors. Every entry is a folder named by its key holding one
+    .npy file per array and a meta.json, written to a temporary folder first and moved into place so
+    concurrent runs never read a partial entry. The modification time of an entry folder is its last
+    use, the entries used longest ago are removed once the cache is larger than max_bytes.
+    '''
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        '''
+        Input:
+            - cache_dir: folder holding the entries
+            - max_bytes: integer disk budget of the cache, the newest entry is always kept
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(**params):
+        '''
+        Key of an entry.
+
+        Input:
+            - params: the preparation inputs, e.g. ticker, dates, window, sequence_length and source fingerprint
+
+        Return: hex string
+        '''
+        payload = json.dumps(params, sort_keys=True, default=str)
+
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        '''
+        Attach an entry, the arrays are read-only memory maps of the cached files.
+
+        Input:
+            - key: string key of the entry
+
+        Return: dictionary of the cached arrays and RollingScalers, None when the key is not cached or
+                its entry cannot be read (the entry is then removed so it can be built again)
+        '''
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        except UNREADABLE:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        try:
+            tensors = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in meta['arrays']}
+
+            for name, scaler_meta in meta['scalers'].items():
+                tensors[name] = load_scaler(path, name, scaler_meta)
+        except UNREADABLE:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        # mark the entry as used for the LRU eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return tensors
+
+    def store(self, key, tensors, params=None):
+        '''
+        Write an entry and evict the least recently used entries over the disk budget.
+
+        Input:
+            - key: string key of the entry
+            - tensors: dictionary of names to arrays or fitted RollingScalers
+            - params: optional dictionary of the preparation inputs, kept in meta.json for reference
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta = {'params': params, 'arrays': [], 'scalers': {}, 'created': time.time()}
+
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            for name, value in tensors.items():
+                if isinstance(value, RollingScaler):
+                    meta['scalers'][name] = save_scaler(tmp_path, name, value)
+                else:
+                    np.save(os.path.join(tmp_path, f'{name}.npy'), _plain_array(name, value))
+                    meta['arrays'].append(name)
+
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump(meta, f, default=str)
+
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            # another run stored the same key first, its entry holds the same tensors
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.exists(os.path.join(self._path(key), 'meta.json')):
+                raise
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+
+    def get_or_build(self, build, **params):
+        '''
+        Attach the entry of the preparation inputs, running build and caching its tensors on a miss.
+
+        Input:
+            - build: function without arguments returning a dictionary of names to arrays or fitted RollingScalers
+            - params: the preparation inputs the key is hashed from, include the source fingerprint
+
+        Return: dictionary of the cached arrays (memory maps) and RollingScalers
+        '''
+        key = self.key(**params)
+        tensors = self.load(key)
+
+        if tensors is None:
+            self.store(key, build(), params)
+            tensors = self.load(key)
+
+        return tensors
+
+    def entries(self):
+        '''
+        Return: DataFrame with one row per entry holding its key, bytes on disk and last use, oldest use first
+        '''
+        rows = []
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_dir() or entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                    last_used = entry.stat().st_mtime
+                except FileNotFoundError:
+                    # evicted by another run while scanning
+                    continue
+                rows.append({'key': entry.name, 'bytes': size, 'last_used': pd.Timestamp(last_used, unit='s')})
+
+        return pd.DataFrame(rows, columns=['key', 'bytes', 'last_used']).sort_values('last_used', ignore_index=True)
+
+    def evict(self, keep=None):
+        '''
+        Remove the least recently used entries until the cache fits max_bytes.
+
+        Input:
+            - keep: optional key that is never removed, e.g. the entry just stored
+
+        Return: list of the removed keys
+        '''
+        entries = self.entries()
+        total = entries['bytes'].sum()
+        removed = []
+
+        for key, size in zip(entries['key'], entries['bytes']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+
+        return removed
+
+    def clear(self):
+        '''
+        Remove every entry.
+        '''
+        for key in self.entries()['key']:
+            shutil.rmtree(self._path(key), ignore_errors=True)
@@ -0,0 +1,131 @@
+"""
+This file contains the export of a prepared training set to a memory
+mapped folder shared by the tuner trials. Only the 2D scaled rows are
+written, every worker maps the same files read-only and builds the RNN
+windows as views, so parallel trials share one copy of the data in the
+page cache instead of holding one copy each.
+
+Usage:
+    export_shared_dataset('shared_train', x_train_normalized, y_train_normalized, 20, y_scaler=scaler)
+
+    # in every trial
+    data = load_shared_dataset('shared_train')
+    batches = WindowBatches(data['x_rows'], data['y_rows'], data['sequence_length'], batch_size=28)
+    model.fit(batches.repeat(), steps_per_epoch=len(batches), epochs=50)
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from data_etl_rnn_prep import RollingScaler, sequence_windows, index_to_array, index_from_array, save_scaler, load_scaler
+
+
+def export_shared_dataset(path, x_rnn_train_normalized, y_rnn_train_normalized, sequence_length, dtype=np.float64, **scalers):
+    '''
+    Write the data behind re_shape_df(sequence_length, x, y, train_set=True) to a folder of .npy files. The
+    folder is written next to path and moved into place, so workers never map a partial export.
+
+    Input:
+        - path: folder of the export, replaced when it exists
+        - x_rnn_train_normalized: dataframe containing our independent variables
+        - y_rnn_train_normalized: dataframe containing our dependent varialbes
+        - sequence_length: integer value that represents the number of days which the RNN model will consider
+        - dtype: float dtype of the stored rows, np.float64 like re_shape_df, np.float32 halves the export
+        - scalers: fitted RollingScalers to ship along by name, e.g. y_scaler=scaler
+    '''
+    x = x_rnn_train_normalized.to_numpy(dtype=dtype)
+    y = y_rnn_train_normalized.to_numpy(dtype=dtype)
+    if len(x) != len(y) or not x_rnn_train_normalized.index.equals(y_rnn_train_normalized.index):
+        raise ValueError('x and y must hold the same rows')
+    if len(x) <= sequence_length:
+        raise ValueError(f'{len(x)} rows give no sample of sequence length {sequence_length}')
+
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+
+    # the dates are saved without Python objects so they can be memory-mapped
+    index, index_kind = index_to_array(x_rnn_train_normalized.index)
+    meta = {
+        'sequence_length': sequence_length,
+        'x_columns': [str(col) for col in x_rnn_train_normalized.columns],
+        'y_columns': [str(col) for col in y_rnn_train_normalized.columns],
+        'index_kind': index_kind,
+        'scalers': {}
+    }
+
+    tmp_path = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+    try:
+        np.save(os.path.join(tmp_path, 'x.npy'), x)
+        np.save(os.path.join(tmp_path, 'y.npy'), y)
+        np.save(os.path.join(tmp_path, 'index.npy'), index)
+
+        for name, scaler in scalers.items():
+            if not isinstance(scaler, RollingScaler):
+                raise TypeError(f'{name} is not a RollingScaler')
+            meta['scalers'][name] = save_scaler(tmp_path, name, scaler)
+
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        # workers that already mapped the old export keep reading its files until they close them
+        if os.path.exists(path):
+            old_path = tempfile.mkdtemp(dir=parent, suffix='.old')
+            os.replace(path, os.path.join(old_path, 'export'))
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def load_shared_dataset(path):
+    '''
+    Map an export of export_shared_dataset read-only. Nothing is read until it is used, and every
+    process mapping the same export shares the same physical pages.
+
+    Input:
+        - path: folder of the export
+
+    Return: dictionary with
+            - x, y: the samples of re_shape_df as read-only views, X of shape [samples, sequence_length, features]
+            - x_rows, y_rows: the 2D scaled rows, e.g. for WindowBatches
+            - index: dates of the targets of the samples
+            - sequence_length, x_columns, y_columns and the shipped RollingScalers by name
+    '''
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    x_rows = np.load(os.path.join(path, 'x.npy'), mmap_mode='r')
+    y_rows = np.load(os.path.join(path, 'y.npy'), mmap_mode='r')
+    index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r')
+    index = index_from_array(index, meta['index_kind'])
+
+    # same samples as re_shape_df, sample i is rows i to i + sequence_length - 1 and the target of its last row
+    sequence_length = meta['sequence_length']
+    n_samples = len(x_rows) - sequence_length
+
+    data = {
+        'x': sequence_windows(x_rows, sequence_length)[:n_samples],
+        'y': y_rows[sequence_length - 1:sequence_length - 1 + n_samples],
+        'x_rows': x_rows,
+        'y_rows': y_rows,
+        'index': index[sequence_length - 1:sequence_length - 1 + n_samples],
+        'sequence_length': sequence_length,
+        'x_columns': meta['x_columns'],
+        'y_columns': meta['y_columns']
+    }
+
+    for name, scaler_meta in meta['scalers'].items():
+        data[name] = load_scaler(path, name, scaler_meta)
+
+    return data
@@ -0,0 +1,183 @@
+"""
+This file contains the walk-forward evaluation of the RNN. The rolling
+window scaling is computed once over the full history and every fold is
+served as slices of those arrays, so adding folds does not recompute
+any features.
+
+Usage:
+    study = WalkForward(x_rnn_kmeans, y_rnn_kmeans, window=20, sequence_length=20)
+    metrics = study.run(evaluate, study.folds(n_splits=5, test_size=120, gap=20))
+
+Author: Christian Ruiz, cr72@rice.edu
+Course: COMP 642
+Instructor: Janell Straach
+"""
+
+# import necessary packages
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from data_etl_rnn_prep import apply_feature_scaling, reverse_rolling_window_scaling, sequence_windows
+
+
+class WalkForward:
+    '''
+    Walk-forward study over one history of features and targets. The scaled features, scaled
+    targets and the min/max values to reverse the target scaling are kept as arrays, and every
+    RNN input sequence is a view into them. A sample is the sequence of sequence_length rows
+    ending at a row together with the targets of that row, so the first rows of every fold
+    reuse the rows before it as warm-up for both the rolling window and the sequence.
+    '''
+
+    def __init__(self, x, y, window=20, sequence_length=20):
+        '''
+        Input:
+            - x: dataframe of the independent variables
+            - y: dataframe of the dependent variables
+            - window: integer rolling window period of the min-max scaling
+            - sequence_length: integer value that represents the number of days which the RNN model will consider
+        '''
+        self.window = window
+        self.sequence_length = sequence_length
+
+        # the rolling min/max only looks back, so scaling the full history once gives every fold its values
+        x_normalized, _, y_normalized, y_min_max_values = apply_feature_scaling(window, x, y, training_set=True)
+
+        # keep the rows where both the features and the targets could be scaled
+        self.index = x_normalized.index[x_normalized.index.isin(y_normalized.index)]
+        min_cols = [f'{col}_min' for col in y.columns]
+        max_cols = [f'{col}_max' for col in y.columns]
+
+        self.x = x_normalized.loc[self.index].to_numpy()
+        self.y = y_normalized.loc[self.index].to_numpy()
+        self.y_min = y_min_max_values.loc[self.index, min_cols].to_numpy()
+        self.y_max = y_min_max_values.loc[self.index, max_cols].to_numpy()
+        self.y_actual = y.loc[self.index].to_numpy()
+        self.y_columns = list(y.columns)
+
+        # sequences[i] holds rows i to i + sequence_length - 1, shape [rows, sequence_length, features]
+        self.sequences = sequence_windows(self.x, sequence_length)
+
+    def folds(self, n_splits, test_size, train_size=None, gap=0):
+        '''
+        Split the history into consecutive test periods at the end of the data, each trained on the rows before it.
+
+        Input:
+            - n_splits: integer number of folds
+            - test_size: integer number of rows of every test period
+            - train_size: integer number of training rows, None to train on all rows before the test period
+            - gap: integer number of rows left out between training and test, set it to the longest
+                   horizon so no training target looks into the test period
+
+        Return: list of dictionaries with the fold number and the (start, stop) row positions of train and test
+        '''
+        first = self.sequence_length - 1
+        test_start = len(self.index) - (n_splits * test_size)
+
+        folds = []
+        for fold in range(n_splits):
+            start = test_start + (fold * test_size)
+            train_stop = start - gap
+            train_start = first if train_size is None else max(first, train_stop - train_size)
+
+            if train_stop <= train_start:
+                raise ValueError(f'fold {fold} has no training rows, use fewer or smaller folds')
+
+            folds.append({'fold': fold, 'train': (train_start, train_stop), 'test': (start, start + test_size)})
+
+        return folds
+
+    def samples(self, start, stop):
+        '''
+        RNN samples of the rows from start to stop, all views of the cached arrays.
+
+        Input:
+            - start: integer first row position, at least sequence_length - 1
+            - stop: integer row position after the last row
+
+        Return: X of shape [rows, sequence_length, features] and y of shape [rows, targets]
+        '''
+        offset = self.sequence_length - 1
+        if start < offset:
+            raise ValueError(f'rows before {offset} have no full sequence')
+
+        return self.sequences[start - offset:stop - offset], self.y[start:stop]
+
+    def fold_data(self, fold):
+        '''
+        Serve one fold.
+
+        Input:
+            - fold: dictionary from folds
+
+        Return: dictionary with the train and test samples, the min/max values and actual targets
+                of the test rows and the dates of the test rows
+        '''
+        x_train, y_train = self.samples(*fold['train'])
+        x_test, y_test = self.samples(*fold['test'])
+        test = slice(*fold['test'])
+
+        return {
+            **fold,
+            'x_train': x_train,
+            'y_train': y_train,
+            'x_test': x_test,
+            'y_test': y_test,
+            'y_test_min': self.y_min[test],
+            'y_test_max': self.y_max[test],
+            'y_test_actual': self.y_actual[test],
+            'test_index': self.index[test]
+        }
+
+    def run(self, evaluate, folds, max_workers=None):
+        '''
+        Evaluate every fold. The folds are independent and run in parallel threads, which share
+        the cached arrays without copying them (numpy and model training release the GIL).
+
+        Input:
+            - evaluate: function taking the dictionary of fold_data and returning a dictionary of metrics
+            - folds: list of dictionaries from folds
+            - max_workers: integer number of threads, 1 runs the folds one after another
+
+        Return: DataFrame with one row per fold holding the train and test dates, rows, seconds and metrics
+        '''
+        def run_fold(fold):
+            start = time.perf_counter()
+            metrics = evaluate(self.fold_data(fold))
+            seconds = time.perf_counter() - start
+
+            (train_start, train_stop), (test_start, test_stop) = fold['train'], fold['test']
+            return {
+                'fold': fold['fold'],
+                'train_start': self.index[train_start],
+                'train_end': self.index[train_stop - 1],
+                'test_start': self.index[test_start],
+                'test_end': self.index[test_stop - 1],
+                'train_rows': train_stop - train_start,
+                'test_rows': test_stop - test_start,
+                'seconds': seconds,
+                **metrics
+            }
+
+        if max_workers == 1:
+            results = [run_fold(fold) for fold in folds]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(run_fold, folds))
+
+        return pd.DataFrame(results).set_index('fold')
+
+
+def scaled_mse(fold_data, predictions):
+    '''
+    Mean squared error of predictions in the scale of the actual prices for every target.
+
+    Input:
+        - fold_data: dictionary from WalkForward.fold_data
+        - predictions: array of scaled predictions of the test rows, shape [rows, targets]
+
+    Return: array of mean squared errors, one per target
+    '''
+    prices = reverse_rolling_window_scaling(predictions, fold_data['y_test_min'], fold_data['y_test_max'])
+
+    return ((fold_data['y_test_actual'] - prices) ** 2).mean(axis=0)
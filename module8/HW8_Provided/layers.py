@@ -1,7 +1,50 @@
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 
-def affine_forward(x, theta, theta0):
+class Workspace(object):
+  """
+  A pool of reusable output buffers for one layer. Pass the same workspace to
+  the forward and backward pass of a layer on every iteration and the layer
+  writes its outputs into buffers allocated on the first batch, with out=
+  arguments instead of fresh arrays. A smaller batch (e.g. the last one of an
+  epoch) uses the leading rows of the buffers.
+
+  Arrays returned by a layer called with a workspace are overwritten by its
+  next call with that workspace, copy them to keep them. Without a workspace
+  (ws=None) every call allocates its outputs as before.
+
+  Layers drawing random numbers (dropout) draw them from self.rng, a numpy
+  Generator seeded from np.random on first use so np.random.seed still makes
+  runs repeatable.
+  """
+
+  def __init__(self):
+    self.buffers = {}
+    self.rng = None
+
+  def get(self, name, shape, dtype):
+    """
+    Return the buffer called name with the given shape and dtype, allocated
+    only when no buffer of at least shape[0] rows exists yet.
+    """
+    buffer = self.buffers.get(name)
+    if (buffer is None or buffer.dtype != dtype or buffer.shape[1:] != tuple(shape[1:])
+        or buffer.shape[0] < shape[0]):
+      buffer = self.buffers[name] = np.empty(shape, dtype=dtype)
+    return buffer[:shape[0]]
+
+
+def _buffer(ws, name, shape, dtype):
+  """
+  Output array of a layer, from the workspace when one is given.
+  """
+  if ws is None:
+    return np.empty(shape, dtype=dtype)
+  return ws.get(name, shape, dtype)
+
+
+def affine_forward(x, theta, theta0, ws=None):
   """
   Computes the forward pass for an affine (fully-connected) layer.
 
@@ -14,6 +57,7 @@ def affine_forward(x, theta, theta0):
   - x: A numpy array containing input data, of shape (m, d_1, ..., d_k)
   - theta: A numpy array of weights, of shape (d, h)
   - theta0: A numpy array of biases, of shape (h,)
+  - ws: Optional Workspace the output is written into
   
   Returns a tuple of:
   - out: output, of shape (m, h)
@@ -25,10 +69,11 @@ def affine_forward(x, theta, theta0):
   # will need to reshape the input into rows.                                 #
   #############################################################################
   # 2 lines of code expected
-  shape_x = x.shape
-  x = np.reshape(x, newshape=(x.shape[0], theta.shape[0]))
-  out = np.dot(x, theta) + np.repeat([theta0],[x.shape[0]],axis = 0)
-  x = np.reshape(x, newshape=shape_x)
+  # the rows of x are a view and theta0 is broadcast over them
+  x_rows = x.reshape(x.shape[0], theta.shape[0])
+  out = _buffer(ws, 'out', (x.shape[0], theta.shape[1]), np.result_type(x, theta, theta0))
+  np.matmul(x_rows, theta, out=out)
+  np.add(out, theta0, out=out)
   #############################################################################
   #                             END OF YOUR CODE                              #
   #############################################################################
@@ -36,7 +81,7 @@ def affine_forward(x, theta, theta0):
   return out, cache
 
 
-def affine_backward(dout, cache):
+def affine_backward(dout, cache, ws=None):
   """
   Computes the backward pass for an affine layer.
 
@@ -46,6 +91,7 @@ def affine_backward(dout, cache):
     - x: Input data, of shape (m, d_1, ... d_k)
     - theta: Weights, of shape (d,h)
     - theta0: biases, of shape (h,)
+  - ws: Optional Workspace the gradients are written into
 
   Returns a tuple of:
   - dx: Gradient with respect to x, of shape (m, d1, ..., d_k)
@@ -58,25 +104,25 @@ def affine_backward(dout, cache):
   # TODO: Implement the affine backward pass.                                 #
   #############################################################################
   # Hint: do not forget to reshape x into (m,d) form
-  shape_x = x.shape
-  x = np.reshape(x,newshape=(x.shape[0],theta.shape[0]))
+  x_rows = x.reshape(x.shape[0], theta.shape[0])
   # 4-5 lines of code expected
-  dtheta0 = np.sum(dout, axis=0)
-  dtheta = np.dot(np.transpose(x),dout)
-  dx = np.dot(dout, np.transpose(theta))
-  dx = np.reshape(dx,shape_x)
+  dtheta0 = np.sum(dout, axis=0, out=_buffer(ws, 'dtheta0', theta0.shape, dout.dtype))
+  dtheta = np.matmul(x_rows.T, dout, out=_buffer(ws, 'dtheta', theta.shape, np.result_type(x, dout)))
+  dx = np.matmul(dout, theta.T, out=_buffer(ws, 'dx', x_rows.shape, np.result_type(dout, theta)))
+  dx = dx.reshape(x.shape)
   #############################################################################
   #                             END OF YOUR CODE                              #
   #############################################################################
   return dx, dtheta, dtheta0
 
 
-def relu_forward(x):
+def relu_forward(x, ws=None):
   """
   Computes the forward pass for a layer of rectified linear units (ReLUs).
 
   Input:
   - x: Inputs, of any shape
+  - ws: Optional Workspace the output is written into
 
   Returns a tuple of:
   - out: Output, of the same shape as x
@@ -87,7 +133,7 @@ def relu_forward(x):
   # TODO: Implement the ReLU forward pass.                                    #
   #############################################################################
   # 1 line of code expected
-  out = np.maximum(x, 0)
+  out = np.maximum(x, 0, out=_buffer(ws, 'out', x.shape, x.dtype))
   #############################################################################
   #                             END OF YOUR CODE                              #
   #############################################################################
@@ -95,13 +141,14 @@ def relu_forward(x):
   return out, cache
 
 
-def relu_backward(dout, cache):
+def relu_backward(dout, cache, ws=None):
   """
   Computes the backward pass for a layer of rectified linear units (ReLUs).
 
   Input:
   - dout: Upstream derivatives, of any shape
   - cache: Input x, of same shape as dout
+  - ws: Optional Workspace the gradient is written into
 
   Returns:
   - dx: Gradient with respect to x
@@ -112,15 +159,18 @@ def relu_backward(dout, cache):
   #############################################################################
   # 1 line of code expected. Hint: use np.where
   # newx: m,d
-  dout[np.where(x<=0)] = 0
-  dx = dout
+  # dout is left unchanged, the gradient is copied where x > 0
+  mask = np.greater(x, 0, out=_buffer(ws, 'mask', x.shape, bool))
+  dx = _buffer(ws, 'dx', dout.shape, dout.dtype)
+  dx.fill(0)
+  np.copyto(dx, dout, where=mask)
   #############################################################################
   #                             END OF YOUR CODE                              #
   #############################################################################
   return dx
 
 
-def dropout_forward(x, dropout_param):
+def dropout_forward(x, dropout_param, ws=None):
   """
   Performs the forward pass for (inverted) dropout.
 
@@ -133,6 +183,10 @@ def dropout_forward(x, dropout_param):
     - seed: Seed for the random number generator. Passing seed makes this
       function deterministic, which is needed for gradient checking but not in
       real networks.
+  - ws: Optional Workspace the mask and output are written into. The mask is
+    then drawn with a numpy Generator into a reusable buffer, so for the same
+    seed it differs from the mask drawn without a workspace (both keep every
+    neuron with probability p).
 
   Outputs:
   - out: Array of the same shape as x.
@@ -152,8 +206,19 @@ def dropout_forward(x, dropout_param):
     # Store the dropout mask in the mask variable.                            #
     ###########################################################################
     # 2 lines of code expected
-    mask = np.random.binomial(1, p, size=x.shape)
-    out = x * mask
+    if ws is None:
+      mask = np.random.binomial(1, p, size=x.shape)
+    else:
+      # uniform draws into a buffer, a neuron is kept when its draw is below p
+      if 'seed' in dropout_param:
+        rng = np.random.default_rng(dropout_param['seed'])
+      else:
+        if ws.rng is None:
+          ws.rng = np.random.default_rng(np.random.randint(2 ** 31))
+        rng = ws.rng
+      draws = rng.random(out=_buffer(ws, 'draws', x.shape, np.float64))
+      mask = np.less(draws, p, out=_buffer(ws, 'keep', x.shape, bool))
+    out = np.multiply(x, mask, out=_buffer(ws, 'out', x.shape, x.dtype))
     ###########################################################################
     #                            END OF YOUR CODE                             #
     ###########################################################################
@@ -173,13 +238,14 @@ def dropout_forward(x, dropout_param):
   return out, cache
 
 
-def dropout_backward(dout, cache):
+def dropout_backward(dout, cache, ws=None):
   """
   Perform the backward pass for (inverted) dropout.
 
   Inputs:
   - dout: Upstream derivatives, of any shape
   - cache: (dropout_param, mask) from dropout_forward.
+  - ws: Optional Workspace the gradient is written into
   """
   dropout_param, mask = cache
   mode = dropout_param['mode']
@@ -190,7 +256,9 @@ def dropout_backward(dout, cache):
     # TODO: Implement the training phase backward pass for inverted dropout.  #
     ###########################################################################
     # 1 line of code expected
-    dx = np.where(mask > 0.0, dout, 0.0)
+    dx = _buffer(ws, 'dx', dout.shape, dout.dtype)
+    dx.fill(0)
+    np.copyto(dx, dout, where=np.greater(mask, 0, out=_buffer(ws, 'mask', mask.shape, bool)))
     ###########################################################################
     #                            END OF YOUR CODE                             #
     ###########################################################################
@@ -218,8 +286,8 @@ def conv_forward_naive(x, theta, theta0, conv_param):
 
   Returns a tuple of:
   - out: Output data, of shape (m, F, H', W') where H' and W' are given by
-    H' = 1 + (H + 2 * pad - HH) / stride
-    W' = 1 + (W + 2 * pad - WW) / stride
+    H' = 1 + (H + 2 * pad - HH) // stride
+    W' = 1 + (W + 2 * pad - WW) // stride
   - cache: (x, theta, theta0, conv_param)
   """
   out = None
@@ -240,8 +308,8 @@ def conv_forward_naive(x, theta, theta0, conv_param):
   HH = theta.shape[2]
   WW = theta.shape[3]
 
-  H_act = 1 + (H + 2 * conv_param['pad'] - HH) / conv_param['stride']
-  W_act = 1 + (W + 2 * conv_param['pad'] - WW) / conv_param['stride']
+  H_act = 1 + (H + 2 * conv_param['pad'] - HH) // conv_param['stride']
+  W_act = 1 + (W + 2 * conv_param['pad'] - WW) // conv_param['stride']
 
   out = np.zeros((x.shape[0],theta.shape[0],H_act, W_act))
   for i in range(len(pad_x)):
@@ -291,8 +359,8 @@ def conv_backward_naive(dout, cache):
   F, C, HH, WW = theta.shape
   stride = conv_param['stride']
   pad = conv_param['pad']
-  H_act = 1 + (H + 2 * pad - HH) / stride
-  W_act = 1 + (W + 2 * pad - WW) / stride
+  H_act = 1 + (H + 2 * pad - HH) // stride
+  W_act = 1 + (W + 2 * pad - WW) // stride
   pad_x = np.pad(x, pad_width=((0,0),(0,0),(pad,pad),(pad,pad)),mode='constant', constant_values=0)
   dx = np.zeros(pad_x.shape)
   dtheta0 = np.zeros(theta0.shape)
@@ -318,6 +386,129 @@ def conv_backward_naive(dout, cache):
   return dx, dtheta, dtheta0
 
 
+def _conv_output_size(H, W, HH, WW, conv_param):
+  """
+  Output height and width of a convolution, H' and W' of conv_forward_naive.
+  """
+  stride, pad = conv_param['stride'], conv_param['pad']
+  H_act = 1 + (H + 2 * pad - HH) // stride
+  W_act = 1 + (W + 2 * pad - WW) // stride
+  return H_act, W_act
+
+
+def im2col(x_pad, HH, WW, stride, H_act, W_act):
+  """
+  Unrolls every receptive field of a zero-padded input into a column.
+
+  Inputs:
+  - x_pad: Padded input data of shape (m, C, H + 2 * pad, W + 2 * pad)
+  - HH, WW: Height and width of the receptive fields
+  - stride: The number of pixels between adjacent receptive fields
+  - H_act, W_act: Output height and width
+
+  Returns:
+  - cols: Array of shape (C * HH * WW, m * H_act * W_act), row (c, i, j) holds
+    pixel (i, j) of channel c of every receptive field
+  """
+  m, C = x_pad.shape[:2]
+  cols = np.empty((C, HH, WW, m, H_act, W_act), dtype=x_pad.dtype)
+  # one strided copy per filter offset instead of one slice per output pixel
+  for i in range(HH):
+    for j in range(WW):
+      window = x_pad[:, :, i:i + stride * H_act:stride, j:j + stride * W_act:stride]
+      cols[:, i, j] = window.transpose(1, 0, 2, 3)
+  return cols.reshape(C * HH * WW, m * H_act * W_act)
+
+
+def col2im(dcols, x_pad_shape, HH, WW, stride, H_act, W_act):
+  """
+  Inverse of im2col, sums the gradient of every column back onto the pixels
+  of its receptive field. Overlapping receptive fields add up.
+
+  Inputs:
+  - dcols: Array of shape (C * HH * WW, m * H_act * W_act)
+  - x_pad_shape: Shape (m, C, H + 2 * pad, W + 2 * pad) of the padded input
+  - HH, WW, stride, H_act, W_act: As in im2col
+
+  Returns:
+  - dx_pad: Gradient with respect to the padded input
+  """
+  m, C = x_pad_shape[:2]
+  dcols = dcols.reshape(C, HH, WW, m, H_act, W_act)
+  dx_pad = np.zeros(x_pad_shape, dtype=dcols.dtype)
+  for i in range(HH):
+    for j in range(WW):
+      dx_pad[:, :, i:i + stride * H_act:stride, j:j + stride * W_act:stride] += dcols[:, i, j].transpose(1, 0, 2, 3)
+  return dx_pad
+
+
+def conv_forward(x, theta, theta0, conv_param):
+  """
+  A fast implementation of the forward pass for a convolutional layer, the
+  receptive fields are unrolled with im2col and convolved with every filter
+  in a single matrix multiply.
+
+  Inputs and outputs are the same as conv_forward_naive, the cache can be
+  used by conv_backward_naive and conv_backward alike.
+
+  Returns a tuple of:
+  - out: Output data, of shape (m, F, H', W')
+  - cache: (x, theta, theta0, conv_param)
+  """
+  m, C, H, W = x.shape
+  F, _, HH, WW = theta.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  H_act, W_act = _conv_output_size(H, W, HH, WW, conv_param)
+
+  x_pad = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)), mode='constant')
+  cols = im2col(x_pad, HH, WW, stride, H_act, W_act)
+
+  # (F, C * HH * WW) x (C * HH * WW, m * H' * W')
+  out = theta.reshape(F, -1).dot(cols) + theta0[:, None]
+  out = out.reshape(F, m, H_act, W_act).transpose(1, 0, 2, 3)
+  out = np.ascontiguousarray(out)
+
+  cache = (x, theta, theta0, conv_param)
+  return out, cache
+
+
+def conv_backward(dout, cache):
+  """
+  A fast implementation of the backward pass for a convolutional layer, the
+  gradients of theta and of the unrolled receptive fields are single matrix
+  multiplies and col2im sums the receptive fields back into dx.
+
+  Inputs:
+  - dout: Upstream derivatives, of shape (m, F, H', W')
+  - cache: A tuple of (x, theta, theta0, conv_param) as in conv_forward_naive
+    or conv_forward
+
+  Returns a tuple of:
+  - dx: Gradient with respect to x
+  - dtheta: Gradient with respect to theta
+  - dtheta0: Gradient with respect to theta0
+  """
+  x, theta, theta0, conv_param = cache
+  m, C, H, W = x.shape
+  F, _, HH, WW = theta.shape
+  stride, pad = conv_param['stride'], conv_param['pad']
+  H_act, W_act = _conv_output_size(H, W, HH, WW, conv_param)
+
+  # the naive cache keeps no columns, so they are unrolled again
+  x_pad = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)), mode='constant')
+  cols = im2col(x_pad, HH, WW, stride, H_act, W_act)
+
+  dout = dout.transpose(1, 0, 2, 3).reshape(F, -1)
+  dtheta0 = dout.sum(axis=1)
+  dtheta = dout.dot(cols.T).reshape(theta.shape)
+
+  dcols = theta.reshape(F, -1).T.dot(dout)
+  dx = col2im(dcols, x_pad.shape, HH, WW, stride, H_act, W_act)
+  dx = dx[:, :, pad:pad + H, pad:pad + W]
+
+  return dx, dtheta, dtheta0
+
+
 def max_pool_forward_naive(x, pool_param):
   """
   A naive implementation of the forward pass for a max pooling layer.
@@ -342,8 +533,8 @@ def max_pool_forward_naive(x, pool_param):
   stride = pool_param['stride']
   pool_height = pool_param['pool_height']
   pool_width = pool_param['pool_width']
-  new_w = 1 + (W - pool_width) / stride
-  new_h = 1 + (H - pool_height) / stride
+  new_w = 1 + (W - pool_width) // stride
+  new_h = 1 + (H - pool_height) // stride
   out = np.zeros(shape=(m, C, new_h, new_w))
   pool_param['index'] = []
 
@@ -397,8 +588,79 @@ def max_pool_backward_naive(dout, cache):
   return dx
 
 
+def _pool_windows(x, pool_param):
+  """
+  The pooling regions of x as a (m, C, H', W', pool_height, pool_width) view,
+  nothing is copied. When the regions tile x exactly (e.g. 2x2 with stride 2)
+  the view is a 6D reshape of x, otherwise a strided window view.
+  """
+  m, C, H, W = x.shape
+  stride = pool_param['stride']
+  pool_height = pool_param['pool_height']
+  pool_width = pool_param['pool_width']
+
+  if pool_height == stride and pool_width == stride and H % pool_height == 0 and W % pool_width == 0:
+    windows = x.reshape(m, C, H // pool_height, pool_height, W // pool_width, pool_width)
+    return windows.transpose(0, 1, 2, 4, 3, 5)
+
+  new_h = 1 + (H - pool_height) // stride
+  new_w = 1 + (W - pool_width) // stride
+  windows = sliding_window_view(x, (pool_height, pool_width), axis=(2, 3))
+  return windows[:, :, :stride * new_h:stride, :stride * new_w:stride]
+
+
+def max_pool_forward_fast(x, pool_param):
+  """
+  A fast implementation of the forward pass for a max pooling layer. The
+  pooling regions are a view of the input (see _pool_windows) and the max is
+  taken over the region offsets, each a (m, C, H', W') slice of the view.
+
+  Inputs and outputs are the same as max_pool_forward_naive, except that
+  pool_param is not modified.
+
+  Returns a tuple of:
+  - out: Output data, of shape (m, C, H', W')
+  - cache: (x, out, pool_param)
+  """
+  windows = _pool_windows(x, pool_param)
+  out = windows[:, :, :, :, 0, 0].copy()
+  for i in range(pool_param['pool_height']):
+    for j in range(pool_param['pool_width']):
+      np.maximum(out, windows[:, :, :, :, i, j], out=out)
+
+  cache = (x, out, pool_param)
+  return out, cache
+
+
+def max_pool_backward_fast(dout, cache):
+  """
+  A fast implementation of the backward pass for a max pooling layer. The
+  upstream derivative of every region goes to the positions equal to its max,
+  all of them when the max is tied like max_pool_backward_naive, and the
+  derivatives of overlapping regions add up.
+
+  Inputs:
+  - dout: Upstream derivatives, of shape (m, C, H', W')
+  - cache: A tuple of (x, out, pool_param) as in max_pool_forward_fast
+
+  Returns:
+  - dx: Gradient with respect to x
+  """
+  x, out, pool_param = cache
+  windows = _pool_windows(x, pool_param)
+  stride = pool_param['stride']
+  new_h, new_w = out.shape[2:]
+
+  # mask of the max for one region offset at a time, routed to the pixels at that offset
+  dx = np.zeros(x.shape, dtype=np.result_type(x, dout))
+  for i in range(pool_param['pool_height']):
+    for j in range(pool_param['pool_width']):
+      mask = windows[:, :, :, :, i, j] == out
+      dx[:, :, i:i + stride * new_h:stride, j:j + stride * new_w:stride] += np.where(mask, dout, 0)
+  return dx
+
 
-def svm_loss(x, y):
+def svm_loss(x, y, ws=None):
   """
   Computes the loss and gradient using for multiclass SVM classification.
 
@@ -407,6 +669,7 @@ def svm_loss(x, y):
     for the ith input.
   - y: Vector of labels, of shape (m,) where y[i] is the label for x[i] and
     0 <= y[i] < C
+  - ws: Optional Workspace the margins and gradient are written into
 
   Returns a tuple of:
   - loss: Scalar giving the loss
@@ -414,18 +677,19 @@ def svm_loss(x, y):
   """
   m = x.shape[0]
   correct_class_scores = x[np.arange(m), y]
-  margins = np.maximum(0, x - correct_class_scores[:, np.newaxis] + 1.0)
+  margins = np.subtract(x, correct_class_scores[:, np.newaxis], out=_buffer(ws, 'margins', x.shape, x.dtype))
+  margins += 1.0
+  np.maximum(margins, 0, out=margins)
   margins[np.arange(m), y] = 0
   loss = np.sum(margins) / m
-  num_pos = np.sum(margins > 0, axis=1)
-  dx = np.zeros_like(x)
-  dx[margins > 0] = 1
+  dx = np.greater(margins, 0, out=_buffer(ws, 'dx', x.shape, x.dtype))
+  num_pos = np.sum(dx, axis=1)
   dx[np.arange(m), y] -= num_pos
   dx /= m
   return loss, dx
 
 
-def softmax_loss(x, y):
+def softmax_loss(x, y, ws=None):
   """
   Computes the loss and gradient for softmax classification.
 
@@ -434,16 +698,19 @@ def softmax_loss(x, y):
     for the ith input.
   - y: Vector of labels, of shape (m,) where y[i] is the label for x[i] and
     0 <= y[i] < C
+  - ws: Optional Workspace the gradient is written into
 
   Returns a tuple of:
   - loss: Scalar giving the loss
   - dx: Gradient of the loss with respect to x
   """
-  probs = np.exp(x - np.max(x, axis=1, keepdims=True))
+  # the probabilities are computed in place in the buffer of dx
+  probs = np.subtract(x, np.max(x, axis=1, keepdims=True), out=_buffer(ws, 'dx', x.shape, x.dtype))
+  np.exp(probs, out=probs)
   probs /= np.sum(probs, axis=1, keepdims=True)
   m = x.shape[0]
   loss = -np.sum(np.log(probs[np.arange(m), y])) / m
-  dx = probs.copy()
+  dx = probs
   dx[np.arange(m), y] -= 1
   dx /= m
   return loss, dx
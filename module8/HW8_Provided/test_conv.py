@@ -0,0 +1,76 @@
+"""
+Gradient checks of the im2col conv_forward/conv_backward against the naive
+convolution and the numerical gradient.
+
+Usage:
+  python -m pytest -q module8/HW8_Provided/test_conv.py
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from layers import conv_forward, conv_backward, conv_forward_naive, conv_backward_naive
+from gradient_check import eval_numerical_gradient_array
+
+
+def rel_error(x, y):
+  """ returns relative error """
+  return np.max(np.abs(x - y) / (np.maximum(1e-8, np.abs(x) + np.abs(y))))
+
+
+# (m, C, H, W), (F, HH, WW), stride, pad
+SHAPES = [
+  ((2, 3, 7, 7), (4, 3, 3), 1, 1),
+  ((3, 2, 8, 6), (3, 3, 2), 2, 0),
+  ((2, 3, 9, 9), (2, 5, 5), 2, 2),
+  ((1, 1, 5, 5), (1, 1, 1), 1, 0),
+  ((2, 3, 8, 8), (3, 4, 4), 3, 1),
+]
+
+
+@pytest.mark.parametrize('x_shape, theta_shape, stride, pad', SHAPES)
+def test_conv_matches_naive(x_shape, theta_shape, stride, pad):
+  rng = np.random.RandomState(231)
+  x = rng.randn(*x_shape)
+  F, HH, WW = theta_shape
+  theta = rng.randn(F, x_shape[1], HH, WW)
+  theta0 = rng.randn(F)
+  conv_param = {'stride': stride, 'pad': pad}
+
+  out_naive, cache_naive = conv_forward_naive(x, theta, theta0, conv_param)
+  out, cache = conv_forward(x, theta, theta0, conv_param)
+  assert out.shape == out_naive.shape
+  assert rel_error(out, out_naive) < 1e-10
+
+  # either backward takes either cache
+  dout = rng.randn(*out.shape)
+  grads_naive = conv_backward_naive(dout, cache_naive)
+  for grads in (conv_backward(dout, cache), conv_backward(dout, cache_naive)):
+    for grad, grad_naive in zip(grads, grads_naive):
+      assert grad.shape == grad_naive.shape
+      assert rel_error(grad, grad_naive) < 1e-10
+
+
+@pytest.mark.parametrize('x_shape, theta_shape, stride, pad', SHAPES)
+def test_conv_backward_numerical(x_shape, theta_shape, stride, pad):
+  rng = np.random.RandomState(642)
+  x = rng.randn(*x_shape)
+  F, HH, WW = theta_shape
+  theta = rng.randn(F, x_shape[1], HH, WW)
+  theta0 = rng.randn(F)
+  conv_param = {'stride': stride, 'pad': pad}
+
+  out, cache = conv_forward(x, theta, theta0, conv_param)
+  dout = rng.randn(*out.shape)
+  dx, dtheta, dtheta0 = conv_backward(dout, cache)
+
+  dx_num = eval_numerical_gradient_array(lambda x: conv_forward(x, theta, theta0, conv_param)[0], x, dout)
+  dtheta_num = eval_numerical_gradient_array(lambda theta: conv_forward(x, theta, theta0, conv_param)[0], theta, dout)
+  dtheta0_num = eval_numerical_gradient_array(lambda theta0: conv_forward(x, theta, theta0, conv_param)[0], theta0, dout)
+
+  assert rel_error(dx, dx_num) < 1e-7
+  assert rel_error(dtheta, dtheta_num) < 1e-7
+  assert rel_error(dtheta0, dtheta0_num) < 1e-7
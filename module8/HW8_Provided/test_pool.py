@@ -0,0 +1,98 @@
+"""
+Checks of the view based max_pool_forward_fast/max_pool_backward_fast against
+the naive max pooling and a per-region reference of the backward pass.
+
+Usage:
+  python -m pytest -q module8/HW8_Provided/test_pool.py
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from layers import max_pool_forward_fast, max_pool_backward_fast, max_pool_forward_naive, max_pool_backward_naive
+from gradient_check import eval_numerical_gradient_array
+
+
+def max_pool_backward_reference(x, dout, pool_param):
+  """
+  The backward pass one pooling region at a time: the upstream derivative of a
+  region goes to every position of that region equal to its max, and the
+  derivatives of overlapping regions add up.
+  """
+  ph, pw, s = pool_param['pool_height'], pool_param['pool_width'], pool_param['stride']
+  dx = np.zeros_like(x)
+  for i in range(dout.shape[0]):
+    for c in range(dout.shape[1]):
+      for k in range(dout.shape[2]):
+        for l in range(dout.shape[3]):
+          region = x[i, c, k * s:k * s + ph, l * s:l * s + pw]
+          dx[i, c, k * s:k * s + ph, l * s:l * s + pw] += (region == region.max()) * dout[i, c, k, l]
+  return dx
+
+
+# pool_height, pool_width, stride, x shape
+CASES = [
+  (2, 2, 2, (2, 3, 8, 8)),   # tiles x exactly
+  (3, 3, 3, (2, 2, 9, 9)),   # tiles x exactly
+  (2, 2, 2, (2, 3, 9, 7)),   # ragged edge
+  (3, 2, 2, (2, 2, 9, 8)),   # overlapping rows
+  (3, 3, 2, (2, 3, 9, 9)),   # overlapping
+  (2, 3, 1, (1, 2, 6, 7)),   # overlapping, stride 1
+  (2, 2, 3, (2, 2, 8, 8)),   # stride > pool, rows and columns skipped
+]
+
+
+@pytest.mark.parametrize('ph, pw, stride, shape', CASES)
+def test_max_pool_matches_naive(ph, pw, stride, shape):
+  rng = np.random.RandomState(231)
+  x = rng.randn(*shape)
+  pool_param = {'pool_height': ph, 'pool_width': pw, 'stride': stride}
+
+  out_naive, cache_naive = max_pool_forward_naive(x, dict(pool_param))
+  out, cache = max_pool_forward_fast(x, pool_param)
+  assert np.array_equal(out, out_naive)
+  assert pool_param == {'pool_height': ph, 'pool_width': pw, 'stride': stride}
+
+  dout = rng.randn(*out.shape)
+  dx = max_pool_backward_fast(dout, cache)
+  assert pool_param == {'pool_height': ph, 'pool_width': pw, 'stride': stride}
+  assert np.allclose(dx, max_pool_backward_reference(x, dout, pool_param))
+
+  # the naive backward assigns instead of adding, it only agrees when the regions do not overlap
+  if stride >= max(ph, pw):
+    assert np.array_equal(dx, max_pool_backward_naive(dout, cache_naive))
+
+  dx_num = eval_numerical_gradient_array(lambda x: max_pool_forward_fast(x, pool_param)[0], x, dout)
+  assert np.max(np.abs(dx - dx_num)) < 1e-7
+
+
+@pytest.mark.parametrize('ph, pw, stride, shape', CASES)
+def test_max_pool_backward_ties(ph, pw, stride, shape):
+  # few distinct values, so most regions hold their max more than once
+  rng = np.random.RandomState(642)
+  x = rng.randint(0, 3, size=shape).astype(np.float64)
+  pool_param = {'pool_height': ph, 'pool_width': pw, 'stride': stride}
+
+  out, cache = max_pool_forward_fast(x, pool_param)
+  assert np.array_equal(out, max_pool_forward_naive(x, dict(pool_param))[0])
+
+  dout = rng.randn(*out.shape)
+  assert np.allclose(max_pool_backward_fast(dout, cache), max_pool_backward_reference(x, dout, pool_param))
+
+
+def test_max_pool_backward_ties_match_naive():
+  # every 2x2 region holds its own max twice, so the naive global match is local too
+  x = np.full((1, 1, 4, 4), -9.0)
+  for k in range(2):
+    for l in range(2):
+      x[0, 0, 2 * k, 2 * l] = x[0, 0, 2 * k + 1, 2 * l + 1] = 1 + 2 * k + l
+  pool_param = {'pool_height': 2, 'pool_width': 2, 'stride': 2}
+  dout = np.random.RandomState(0).randn(1, 1, 2, 2)
+
+  dx = max_pool_backward_fast(dout, max_pool_forward_fast(x, pool_param)[1])
+  dx_naive = max_pool_backward_naive(dout, max_pool_forward_naive(x, dict(pool_param))[1])
+  assert np.array_equal(dx, dx_naive)
+  assert np.count_nonzero(dx) == 8